@@ -0,0 +1,72 @@
+#  streaming batched scoring of a python model
+#===============================================================
+# INPUT:
+# 1) a fitted model, the plpData matrix and the population rows to score
+# 2) the included columns, whether the model needs dense data, the batch
+#    size and the number of worker threads
+#
+# OUTPUT:
+# the predicted risk written into one preallocated array
+#================================================================
+import numpy as np
+from multiprocessing.pool import ThreadPool
+from compact import as_float
+
+
+def _score_batch(model, plpData, rows, included, dense):
+  X = plpData[rows, :]
+  if included is not None:
+    X = X[:, included]
+  X = as_float(X)
+  if dense:
+    X = X.toarray()
+  return model.predict_proba(X)[:, 1]
+
+
+def predict_batches(model, plpData, rows, included=None, dense=False, batch_size=100000,
+                    workers=1, out=None):
+  """Score plpData[rows, included] in fixed size row batches
+
+  Only one batch (per worker) is sliced, column-selected and optionally
+  densified at a time and the predictions are written into out (allocated
+  when not given). Batches run in a thread pool when workers > 1 - the
+  model and the matrix are shared, not copied.
+  """
+  rows = np.asarray(rows).ravel().astype(np.int64)
+  if included is not None:
+    included = np.asarray(included).ravel().astype(np.int64)
+  if out is None:
+    out = np.empty(rows.shape[0])
+  batch_size = max(1, int(batch_size))
+  starts = range(0, rows.shape[0], batch_size)
+
+  def score(start):
+    end = min(start + batch_size, rows.shape[0])
+    out[start:end] = _score_batch(model, plpData, rows[start:end], included, dense)
+
+  workers = max(1, min(int(workers or 1), len(starts)))
+  if workers == 1:
+    for start in starts:
+      score(start)
+  else:
+    pool = ThreadPool(workers)
+    try:
+      pool.map(score, starts)
+    finally:
+      pool.close()
+      pool.join()
+  return out
+
+
+def predict_population(model, plpData, population, included=None, dense=False,
+                       batch_size=100000, workers=1):
+  """The population with the prediction appended as the last column
+
+  The result is allocated once and the batches write straight into its
+  last column (no np.append copy).
+  """
+  prediction = np.empty((population.shape[0], population.shape[1]+1))
+  prediction[:, :population.shape[1]] = population
+  predict_batches(model, plpData, population[:, 0], included=included, dense=dense,
+                  batch_size=batch_size, workers=workers, out=prediction[:, population.shape[1]])
+  return prediction
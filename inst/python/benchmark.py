@@ -0,0 +1,248 @@
+#  benchmark of the python trainers and the predictor on simulated data
+#===============================================================
+# INPUT:
+# 1) the rows, columns, folds and grid sizes to sweep (comma separated)
+# 2) the models to run (randomForest, adaBoost, mlp, naiveBayes,
+#    decisionTree) and the json file to write
+#
+# OUTPUT:
+# json with the wall time, peak RSS and throughput of every stage (each
+# inst/python script the R fitter runs, then python_predict.py) for
+# every sweep point, plus the library versions so runs of different
+# versions can be compared
+#
+# usage: python benchmark.py --rows 10000,100000 --cols 2000 --grid 1,4 --out bench.json
+# the stages run the inst/python scripts (thin wrappers of the plp_models
+# functions the R fitters call) executed with the inputs set as globals
+#================================================================
+from __future__ import print_function
+import os
+import sys
+import json
+import shutil
+import timeit
+import platform
+import argparse
+import tempfile
+import itertools
+import multiprocessing
+import numpy as np
+from scipy.sparse import coo_matrix
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from sparse_builder import peak_rss
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS = ('randomForest', 'adaBoost', 'mlp', 'naiveBayes', 'decisionTree')
+
+
+def simulate(rows, cols, density=0.01, outcome_rate=0.05, folds=3, test_fraction=0.25,
+             seed=0):
+  """Binary covariate matrix and population in the layout the R side sends
+
+  Covariate prevalence follows a power law (a few common covariates and a
+  long tail of rare ones) with the requested mean density. The outcome
+  depends on ten covariates through a logistic model whose intercept is
+  set to give outcome_rate. The population is (rowIdPython, outcomeCount,
+  indexes): -1 for the test rows and the fold (1..folds) for the others,
+  stratified by outcome like the R person splitter.
+  """
+  rs = np.random.RandomState(seed)
+  prevalence = 1.0 / np.arange(1, cols+1) ** 0.8
+  prevalence = np.minimum(prevalence * density * cols / prevalence.sum(), 0.9)
+  counts = rs.binomial(rows, prevalence)
+  col = np.repeat(np.arange(cols), counts)
+  row = rs.randint(0, rows, col.shape[0])
+  X = coo_matrix((np.ones(col.shape[0]), (row, col)), shape=(rows, cols)).tocsr()
+  X.data[:] = 1
+
+  risk = rs.choice(cols, min(10, cols), replace=False)
+  logit = X[:, risk].dot(rs.normal(1.0, 0.5, risk.shape[0]))
+  low, high = -20.0, 20.0
+  for i in range(50):
+    intercept = (low + high) / 2
+    if np.mean(1 / (1 + np.exp(-(logit + intercept)))) > outcome_rate:
+      high = intercept
+    else:
+      low = intercept
+  y = (rs.rand(rows) < 1 / (1 + np.exp(-(logit + intercept)))).astype(np.float64)
+
+  index = np.zeros(rows)
+  for outcome in (0, 1):
+    members = rs.permutation(np.where(y == outcome)[0])
+    ntest = int(round(test_fraction * members.shape[0]))
+    index[members[:ntest]] = -1
+    index[members[ntest:]] = np.arange(members.shape[0] - ntest) % folds + 1
+  population = np.column_stack([np.arange(rows, dtype=np.float64), y, index])
+  return X, population
+
+
+def _grid(size, values):
+  return np.array([values[i % len(values)] for i in range(size)], dtype=np.float64).reshape(-1, 1)
+
+
+def _all_columns(ns):
+  return np.arange(ns['plpData'].shape[1]).reshape(-1, 1)
+
+
+def _stages(model, grid, trees):
+  """The (stage name, script, globals to set before it) of a model
+
+  The globals reproduce what the R fitter sets (and what it derives
+  between the scripts, e.g. the columns kept by the variable importance).
+  """
+  predict = ('predict', 'python_predict.py',
+             lambda ns: dict(dense=0, model_loc=ns['modelOutput'], batch_size=100000,
+                             model_cache_mb=2048,
+                             included=ns.get('included', _all_columns(ns))))
+  if model == 'randomForest':
+    return [('var_imp', 'rf_var_imp.py', lambda ns: dict(var_imp_method=ns['var_imp_method'])),
+            ('cv', 'randomForestCV.py',
+             lambda ns: dict(ntrees_grid=_grid(grid, [trees]),
+                             max_depth_grid=_grid(grid, [4, 10, 17]),
+                             mtry_grid=_grid(grid, [-1]),
+                             included=np.where(ns['var_imp'] > np.mean(ns['var_imp']))[0].reshape(-1, 1))),
+            ('final', 'finalRandomForest.py',
+             lambda ns: dict(ntrees=trees, max_depth=int(ns['max_depth_grid'][ns['best_index'], 0]),
+                             mtry=-1)),
+            predict]
+  if model == 'adaBoost':
+    return [('cv', 'adaBoost.py', lambda ns: dict(train=True, n_estimators_grid=_grid(grid, [50, 100, 200]),
+                                                  learning_rate_grid=_grid(grid, [1.0, 1.0, 1.0, 0.5]))),
+            ('final', 'adaBoost.py', lambda ns: dict(train=False, n_estimators=50, learning_rate=1.0)),
+            predict]
+  if model == 'mlp':
+    return [('cv', 'mlp.py', lambda ns: dict(train=True, size=4, alpha=0.00001, streaming=False,
+                                             mlp_batch_size=1000, mlp_max_epochs=50,
+                                             mlp_validation_fraction=0.1, mlp_patience=3)),
+            ('final', 'mlp.py', lambda ns: dict(train=False)),
+            predict]
+  if model == 'naiveBayes':
+    return [('cv_final', 'naive_bayes.py', lambda ns: dict(nb_type='gaussian', featnum=2000)),
+            ('predict', 'python_predict.py',
+             lambda ns: dict(dense=0, model_loc=ns['modelOutput'], batch_size=100000,
+                             model_cache_mb=2048,
+                             included=ns['included'].reshape(-1, 1)))]
+  if model == 'decisionTree':
+    return [('cv', 'decisionTree.py', lambda ns: dict(train=True, max_depth=10, min_samples_split=2,
+                                                      min_samples_leaf=10, min_impurity_split=1e-7,
+                                                      class_weight=None, plot=False)),
+            ('final', 'decisionTree.py', lambda ns: dict(train=False)),
+            predict]
+  raise ValueError('Unknown model %s - use one of %s' % (model, ', '.join(MODELS)))
+
+
+def _run_model(point, model, config, queue):
+  """Run the stages of one model in this (child) process and report each"""
+  if not config['verbose']:
+    sys.stdout = open(os.devnull, 'w')
+  X, population = simulate(point['rows'], point['cols'], density=config['density'],
+                           outcome_rate=config['outcome_rate'], folds=point['folds'],
+                           seed=config['seed'])
+  workdir = tempfile.mkdtemp(prefix='plp_bench_')
+  ns = dict(__name__='__main__', plpData=X, population=population, seed=config['seed'],
+            quiet=True, workers=config['workers'], var_imp_method=config['var_imp_method'],
+            modelOutput=os.path.join(workdir, 'model'))
+  data_rss = peak_rss()
+  try:
+    for stage, script, setup in _stages(model, point['grid'], config['trees']):
+      result = dict(point, model=model, stage=stage, script=script, error=None)
+      try:
+        ns.update(setup(ns))
+        path = os.path.join(SCRIPT_DIR, script)
+        # dont_inherit: the scripts do not use this module's __future__ imports
+        code = compile(open(path).read(), path, 'exec', 0, True)
+        start_time = timeit.default_timer()
+        exec(code, ns)
+        result['seconds'] = timeit.default_timer() - start_time
+        scored = population.shape[0] if stage == 'predict' else int(np.sum(population[:, 2] > 0))
+        result['rows_per_second'] = scored / max(result['seconds'], 1e-9)
+      except Exception as err:
+        result['error'] = '%s: %s' % (type(err).__name__, err)
+      rss = peak_rss()
+      result['peak_rss_mb'] = None if rss is None else rss / 1048576.0
+      result['data_rss_mb'] = None if data_rss is None else data_rss / 1048576.0
+      queue.put(result)
+      if result['error'] is not None:
+        break
+  finally:
+    shutil.rmtree(workdir, ignore_errors=True)
+    queue.put(None)
+
+
+def run_point(point, model, config):
+  """The stage results of one model at one sweep point (fresh process, so
+  the peak RSS belongs to this model only)"""
+  queue = multiprocessing.Queue()
+  process = multiprocessing.Process(target=_run_model, args=(point, model, config, queue))
+  process.start()
+  results = []
+  while True:
+    result = queue.get()
+    if result is None:
+      break
+    results.append(result)
+  process.join()
+  if process.exitcode != 0 and not any(r['error'] for r in results):
+    results.append(dict(point, model=model, stage=None, script=None,
+                        error='process exited with code %s' % process.exitcode))
+  return results
+
+
+def environment():
+  versions = dict(python=platform.python_version(), numpy=np.__version__)
+  for name in ('scipy', 'sklearn'):
+    try:
+      versions[name] = __import__(name).__version__
+    except ImportError:
+      versions[name] = None
+  return dict(versions=versions, platform=platform.platform(),
+              processor=platform.processor(), cpus=multiprocessing.cpu_count())
+
+
+def _ints(text):
+  return [int(v) for v in text.split(',')]
+
+
+def main(args=None):
+  parser = argparse.ArgumentParser(description='Benchmark the python models on simulated data')
+  parser.add_argument('--rows', type=_ints, default=[10000])
+  parser.add_argument('--cols', type=_ints, default=[1000])
+  parser.add_argument('--folds', type=_ints, default=[3])
+  parser.add_argument('--grid', type=_ints, default=[1],
+                      help='number of hyper-parameter settings cross validated')
+  parser.add_argument('--models', default=','.join(MODELS))
+  parser.add_argument('--density', type=float, default=0.01,
+                      help='mean fraction of non-zero covariates per row')
+  parser.add_argument('--outcome-rate', type=float, default=0.05)
+  parser.add_argument('--trees', type=int, default=100,
+                      help='trees of the random forest grid points')
+  parser.add_argument('--var-imp-method', default='forest')
+  parser.add_argument('--workers', type=int, default=1)
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--label', default='', help='free text stored with the results (e.g. a version)')
+  parser.add_argument('--out', default='benchmark.json')
+  parser.add_argument('--verbose', action='store_true')
+  args = parser.parse_args(args)
+
+  config = dict(density=args.density, outcome_rate=args.outcome_rate, trees=args.trees,
+                var_imp_method=args.var_imp_method, workers=args.workers, seed=args.seed,
+                verbose=args.verbose)
+  results = []
+  for rows, cols, folds, grid in itertools.product(args.rows, args.cols, args.folds, args.grid):
+    point = dict(rows=rows, cols=cols, folds=folds, grid=grid)
+    for model in args.models.split(','):
+      for result in run_point(point, model, config):
+        results.append(result)
+        print('%(model)s %(stage)s rows=%(rows)s cols=%(cols)s folds=%(folds)s grid=%(grid)s: ' % result +
+              (result['error'] or '%.2f s, %.0f rows/s, peak RSS %s MB' % (
+                result['seconds'], result['rows_per_second'],
+                'NA' if result['peak_rss_mb'] is None else '%.0f' % result['peak_rss_mb'])))
+  with open(args.out, 'w') as f:
+    json.dump(dict(label=args.label, environment=environment(), config=config,
+                   results=results), f, indent=2)
+  print('Results written to %s' % args.out)
+
+
+if __name__ == '__main__':
+  main()
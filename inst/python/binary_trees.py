@@ -0,0 +1,498 @@
+#  tree learner specialised for binary (0/1) sparse covariates
+#===============================================================
+# INPUT:
+# 1) a covariate matrix whose non-zero values are all 1 (csr, csc or
+#    dense) and the labels (optionally sample weights)
+# 2) the tree settings (depth, minimum samples, features per level...)
+#
+# OUTPUT:
+# BinaryTreeClassifier, BinaryForestClassifier and
+# BinaryAdaBoostClassifier: sklearn compatible estimators (fit,
+# predict_proba, apply, feature_importances_) that replace
+# DecisionTreeClassifier, RandomForestClassifier and AdaBoostClassifier
+# (its stumps) when every covariate is an indicator
+#
+# an indicator has a single split (0 left, 1 right) so no thresholds are
+# searched: the columns are kept as inverted row lists (the csc indices)
+# and a whole level of a tree is grown at once - the weight, weighted
+# outcome and row count of every (node, candidate column) pair are
+# histograms (bincount) over the entries of the candidate columns, and
+# the node totals give the counts of the rows without the covariate
+#================================================================
+from __future__ import division
+import weakref
+import numpy as np
+from scipy.sparse import issparse, csc_matrix, csr_matrix
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.ensemble import AdaBoostClassifier
+
+# the largest (nodes x candidate columns) histogram made in one pass
+HISTOGRAM_CELLS = 2**21
+# levels with up to this many splittable nodes make their histograms of
+# all the columns with one sparse x dense product instead of bincount
+PRODUCT_NODES = 4
+MAX_INT = np.iinfo(np.int32).max
+# the columns of the last matrix fitted or scored (boosting fits and scores
+# the same matrix every round) - dropped when that matrix is
+_last = {}
+
+
+def is_binary(X):
+  """True when every non-zero value of X is 1"""
+  data = X.data if issparse(X) else np.asarray(X).ravel()
+  return bool(np.all(data[data != 0] == 1))
+
+
+class BinaryColumns(object):
+  """The inverted row lists of a binary matrix
+
+  matrix is the (columns x rows) csr matrix of ones, so the rows of
+  column j are matrix.indices[matrix.indptr[j]:matrix.indptr[j+1]]. Any
+  non-zero value is taken as a 1.
+  """
+
+  def __init__(self, X):
+    if issparse(X):
+      X = csc_matrix(X)
+      if np.any(X.data == 0):
+        X = X.copy()
+        X.eliminate_zeros()
+      X = csr_matrix((np.ones(X.nnz), X.indices, X.indptr), shape=X.shape[::-1])
+    else:
+      X = csr_matrix((np.asarray(X) != 0).T, dtype=np.float64)
+    self.matrix = X
+    self.shape = X.shape[::-1]
+    self._column_of = None
+
+  def entries(self, cols=None):
+    """The rows of the entries of cols (all columns when None) and the
+    position in cols of each"""
+    indptr, indices = self.matrix.indptr, self.matrix.indices
+    if cols is None:
+      if self._column_of is None:
+        self._column_of = np.repeat(np.arange(self.shape[1], dtype=np.int32), np.diff(indptr))
+      return indices, self._column_of
+    cols = np.asarray(cols, dtype=np.int64)
+    starts = indptr[cols].astype(np.int64)
+    lens = indptr[cols+1] - starts
+    pos = np.repeat(np.arange(cols.shape[0]), lens)
+    offsets = np.repeat(starts - (np.cumsum(lens) - lens), lens)
+    return indices[offsets + np.arange(pos.shape[0])], pos
+
+  def dot(self, cols, M):
+    """(matrix of cols) x M - the column sums of M over the rows of each column"""
+    return (self.matrix if cols is None else self.matrix[cols]).dot(M)
+
+
+def columns_of(X):
+  """BinaryColumns of X, reused while the same X is passed again"""
+  if isinstance(X, BinaryColumns):
+    return X
+  ref = _last.get('ref')
+  if ref is not None and ref() is X:
+    return _last['columns']
+  columns = BinaryColumns(X)
+  _last.clear()
+  try:
+    _last['ref'] = weakref.ref(X, _forget)
+    _last['columns'] = columns
+  except TypeError:
+    pass
+  return columns
+
+
+def _forget(ref):
+  if _last.get('ref') is ref:
+    _last.clear()
+
+
+def _gini(W, P):
+  """Gini impurity of nodes times their weight (W total, P of outcome 1)"""
+  with np.errstate(divide='ignore', invalid='ignore'):
+    return np.where(W > 0, 2 * P * (W - P) / W, 0.0)
+
+
+def _n_features(max_features, ncol):
+  if max_features is None:
+    m = ncol
+  elif max_features in ('sqrt', 'auto'):
+    m = int(np.sqrt(ncol))
+  elif max_features == 'log2':
+    m = int(np.log2(ncol))
+  elif isinstance(max_features, float) and max_features <= 1:
+    m = int(max_features * ncol)
+  else:
+    m = int(max_features)
+  return max(1, min(ncol, m))
+
+
+class Tree(object):
+  """The arrays of a fitted tree (feature -1 marks a leaf; left is the
+  branch of the rows without the feature)"""
+
+  def __init__(self, feature, left, right, value, n_node_samples, weight, max_depth):
+    self.feature = feature
+    self.left = left
+    self.right = right
+    self.value = value
+    self.n_node_samples = n_node_samples
+    self.weight = weight
+    self.node_count = feature.shape[0]
+    self.max_depth = max_depth
+
+  def apply(self, columns):
+    """The leaf of every row of columns (a BinaryColumns)"""
+    node = np.zeros(columns.shape[0], dtype=np.int64)
+    # the rows still in internal nodes
+    rows = np.arange(columns.shape[0]) if self.feature[0] >= 0 else np.array([], dtype=np.int64)
+    has = np.zeros(columns.shape[0], dtype=np.int64)
+    while rows.shape[0] > 0:
+      feature = self.feature[node[rows]]
+      used = np.unique(feature)
+      entry_rows, pos = columns.entries(used)
+      hit = entry_rows[self.feature[node[entry_rows]] == used[pos]]
+      has[hit] = 1
+      node[rows] = self.left[node[rows]] + has[rows]
+      has[hit] = 0
+      rows = rows[self.feature[node[rows]] >= 0]
+    return node
+
+
+def _grow(arrays, size):
+  """The node arrays with room for size nodes"""
+  if arrays[0].shape[0] >= size:
+    return arrays
+  capacity = max(size, 2 * arrays[0].shape[0])
+  return [np.concatenate([a, np.full(capacity - a.shape[0], -1, dtype=a.dtype)]) for a in arrays]
+
+
+def _ranges(starts, ends):
+  """The concatenated ranges [starts[i], ends[i]) and the index i of each"""
+  lens = ends - starts
+  index = np.repeat(np.arange(starts.shape[0]), lens)
+  return np.repeat(starts - (np.cumsum(lens) - lens), lens) + np.arange(index.shape[0]), index
+
+
+def _segment(position, starts, ends):
+  """The segment (of the sorted, disjoint [starts, ends)) of each position,
+  -1 when it is in none"""
+  seg = np.searchsorted(starts, position, side='right') - 1
+  inside = (seg >= 0) & (position < ends[np.maximum(seg, 0)])
+  return np.where(inside, seg, -1)
+
+
+def _histograms(columns, cols, order, starts, ends, pos_of_row, w, wy, unit):
+  """Yield (first node, W1, P1, N1) for the candidate columns of the nodes
+  of a level (the segments [starts, ends) of order): the weight, weighted
+  outcome and row count of the rows of each node that have each column.
+  With unit weights W1 is N1."""
+  nslots = starts.shape[0]
+  m = columns.shape[1] if cols is None else cols.shape[0]
+  if cols is None and nslots <= PRODUCT_NODES:
+    positions, slot = _ranges(starts, ends)
+    live = order[positions]
+    k = 2 if unit else 3
+    M = np.zeros((columns.shape[0], k * nslots))
+    M[live, k * slot] = 1
+    M[live, k * slot + 1] = wy[live]
+    if not unit:
+      M[live, k * slot + 2] = w[live]
+    H = columns.dot(cols, M).T
+    N1, P1 = H[0::k], H[1::k]
+    yield 0, N1 if unit else H[2::k], P1, N1
+    return
+
+  rows, pos = columns.entries(cols)
+  slots = _segment(pos_of_row[rows], starts, ends)
+  keep = slots >= 0
+  rows, pos, slots = rows[keep], pos[keep], slots[keep]
+  chunk = max(1, HISTOGRAM_CELLS // m)
+  for start in range(0, nslots, chunk):
+    end = min(nslots, start + chunk)
+    if start == 0 and end == nslots:
+      r, key = rows, slots * m + pos
+    else:
+      inside = (slots >= start) & (slots < end)
+      r, key = rows[inside], (slots[inside] - start) * m + pos[inside]
+    size, shape = (end - start) * m, (end - start, m)
+    N1 = np.bincount(key, minlength=size).reshape(shape).astype(np.float64)
+    P1 = np.bincount(key, weights=wy[r], minlength=size).reshape(shape)
+    W1 = N1 if unit else np.bincount(key, weights=w[r], minlength=size).reshape(shape)
+    yield start, W1, P1, N1
+
+
+def grow_tree(columns, y, w, max_depth=None, min_samples_split=2, min_samples_leaf=1,
+              min_impurity_split=1e-7, max_features=None, rs=None):
+  """Grow a tree level by level on the rows with weight > 0
+
+  y is 0/1 and w the row weights. max_features columns are drawn for each
+  level (shared by its nodes, like colsample_bylevel) when it is less
+  than the number of columns. The rows are kept ordered by node (every
+  node is a segment of the order) and a split only moves the rows that
+  have its column, so the work of a level follows the entries of its
+  columns rather than the number of rows. Returns the Tree and the total
+  impurity decrease (weighted) of each column.
+  """
+  n, ncol = columns.shape
+  m = _n_features(max_features, ncol)
+  if rs is None:
+    rs = np.random.RandomState()
+  wy = w * y
+  order = np.where(w > 0)[0]
+  pos_of_row = np.full(n, -1, dtype=np.int64)
+  pos_of_row[order] = np.arange(order.shape[0])
+  marked = np.zeros(order.shape[0], dtype=bool)
+  unit = bool(np.all(w[order] == 1))
+  # feature, left, right, first and last + 1 position in order, weight,
+  # weighted outcome and rows of every node
+  arrays = [np.full(64, -1, dtype=np.int64) for i in range(5)] + \
+           [np.full(64, -1, dtype=np.float64) for i in range(3)]
+  arrays[3][0], arrays[4][0] = 0, order.shape[0]
+  arrays[5][0], arrays[6][0], arrays[7][0] = np.sum(w[order]), np.sum(wy[order]), order.shape[0]
+  count = 1
+  importance = np.zeros(ncol)
+
+  frontier = np.array([0])
+  depth = 0
+  while frontier.shape[0] > 0 and (max_depth is None or depth < max_depth):
+    Wn, Pn, Nn = arrays[5][frontier], arrays[6][frontier], arrays[7][frontier]
+    impurity = _gini(Wn, Pn) / np.maximum(Wn, 1e-300)
+    splittable = (Nn >= min_samples_split) & (Nn >= 2 * min_samples_leaf) & \
+                 (impurity > min_impurity_split)
+    # the frontier is in order position so its segments are sorted
+    nodes = frontier[splittable]
+    if nodes.shape[0] == 0:
+      break
+    Wn, Pn, Nn = Wn[splittable], Pn[splittable], Nn[splittable]
+    starts, ends = arrays[3][nodes], arrays[4][nodes]
+
+    cols = None if m >= ncol else np.sort(rs.choice(ncol, m, replace=False))
+    best_gain = np.zeros(nodes.shape[0])
+    best_col = -np.ones(nodes.shape[0], dtype=np.int64)
+    best = np.zeros((3, nodes.shape[0]))
+    for start, W1, P1, N1 in _histograms(columns, cols, order, starts, ends, pos_of_row, w, wy,
+                                         unit):
+      end = start + W1.shape[0]
+      W, P, N = Wn[start:end, None], Pn[start:end, None], Nn[start:end, None]
+      gain = _gini(W, P) - _gini(W1, P1) - _gini(W - W1, P - P1)
+      gain[(N1 < min_samples_leaf) | (N - N1 < min_samples_leaf)] = -np.inf
+      j = np.argmax(gain, axis=1)
+      k = np.arange(end - start)
+      best_gain[start:end] = gain[k, j]
+      best_col[start:end] = j if cols is None else cols[j]
+      best[:, start:end] = W1[k, j], P1[k, j], N1[k, j]
+
+    # zero gain splits (e.g. of a pure column set) are not made
+    split = best_gain > 1e-12 * Wn
+    nsplit = int(np.sum(split))
+    if nsplit == 0:
+      break
+    parents, col = nodes[split], best_col[split]
+    np.add.at(importance, col, best_gain[split])
+    W1, P1, N1 = best[:, split]
+    starts, ends = starts[split], ends[split]
+    mid = ends - np.round(N1).astype(np.int64)
+
+    # move the rows that have the column to the end of their node: the
+    # ones before mid swap with the rows without it at or after mid
+    used = np.unique(col)
+    rows, pos = columns.entries(used)
+    position = pos_of_row[rows]
+    seg = _segment(position, starts, ends)
+    hit = np.sort(position[(seg >= 0) & (col[np.maximum(seg, 0)] == used[pos])])
+    marked[hit] = True
+    misplaced = hit[hit < mid[_segment(hit, starts, ends)]]
+    tail, tail_seg = _ranges(mid, ends)
+    free = tail[~marked[tail]]
+    marked[hit] = False
+    moving, staying = order[misplaced], order[free]
+    order[misplaced], order[free] = staying, moving
+    pos_of_row[moving], pos_of_row[staying] = free, misplaced
+
+    arrays = _grow(arrays, count + 2 * nsplit)
+    feature, left, right, first, last, W, P, N = arrays
+    # the children of a node are consecutive (right = left + 1)
+    children = count + 2 * np.arange(nsplit)
+    feature[parents], left[parents], right[parents] = col, children, children + 1
+    first[children], last[children] = starts, mid
+    first[children + 1], last[children + 1] = mid, ends
+    W[children], P[children], N[children] = Wn[split] - W1, Pn[split] - P1, Nn[split] - N1
+    W[children + 1], P[children + 1], N[children + 1] = W1, P1, N1
+    frontier = np.arange(count, count + 2 * nsplit)
+    count += 2 * nsplit
+    depth += 1
+
+  feature, left, right, first, last, W, P, N = [a[:count] for a in arrays]
+  with np.errstate(divide='ignore', invalid='ignore'):
+    value = np.where(W > 0, P / W, 0.0)
+  tree = Tree(feature, left, right, value, N.astype(np.int64), W, depth)
+  return tree, importance
+
+
+def _labels(estimator, y, sample_weight):
+  """The 0/1 labels and the row weights (class_weight applied)"""
+  y = np.asarray(y).ravel()
+  estimator.classes_, y = np.unique(y, return_inverse=True)
+  estimator.n_classes_ = estimator.classes_.shape[0]
+  if estimator.n_classes_ > 2:
+    raise ValueError('Binary trees fit two classes only')
+  w = np.ones(y.shape[0]) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+  class_weight = getattr(estimator, 'class_weight', None)
+  if class_weight == 'balanced':
+    counts = np.bincount(y, minlength=estimator.n_classes_)
+    w = w * (y.shape[0] / (estimator.n_classes_ * counts.astype(np.float64)))[y]
+  elif isinstance(class_weight, dict):
+    w = w * np.array([class_weight.get(c, 1.0) for c in estimator.classes_])[y]
+  return y.astype(np.float64), w
+
+
+def _proba(classes, value):
+  if classes.shape[0] == 1:
+    return np.ones((value.shape[0], 1))
+  return np.column_stack([1 - value, value])
+
+
+class BinaryTreeClassifier(BaseEstimator, ClassifierMixin):
+  """Gini decision tree on binary covariates (see grow_tree)
+
+  Has the DecisionTreeClassifier parameters the python models use; the
+  covariates are read as indicators (any non-zero value is a 1). Columns
+  with the same gain are split on the lowest one, where sklearn draws one
+  at random, so beyond the first levels (where ties are rare) the trees
+  can differ from sklearn's on the same data.
+  """
+
+  def __init__(self, max_depth=None, min_samples_split=2, min_samples_leaf=1,
+               min_impurity_split=1e-7, max_features=None, class_weight=None,
+               random_state=None):
+    self.max_depth = max_depth
+    self.min_samples_split = min_samples_split
+    self.min_samples_leaf = min_samples_leaf
+    self.min_impurity_split = min_impurity_split
+    self.max_features = max_features
+    self.class_weight = class_weight
+    self.random_state = random_state
+
+  def _fit_columns(self, columns, y, w, rs):
+    self.n_features_ = columns.shape[1]
+    self.tree_, importance = grow_tree(columns, y, w, max_depth=self.max_depth,
+                                       min_samples_split=self.min_samples_split,
+                                       min_samples_leaf=self.min_samples_leaf,
+                                       min_impurity_split=self.min_impurity_split,
+                                       max_features=self.max_features, rs=rs)
+    total = importance.sum()
+    self.feature_importances_ = importance / total if total > 0 else importance
+    return self
+
+  def fit(self, X, y, sample_weight=None):
+    y, w = _labels(self, y, sample_weight)
+    rs = self.random_state
+    if not isinstance(rs, np.random.RandomState):
+      rs = np.random.RandomState(rs)
+    return self._fit_columns(columns_of(X), y, w, rs)
+
+  def apply(self, X):
+    return self.tree_.apply(columns_of(X))
+
+  def predict_proba(self, X):
+    return _proba(self.classes_, self.tree_.value[self.apply(X)])
+
+  def predict(self, X):
+    return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+class BinaryForestClassifier(BaseEstimator, ClassifierMixin):
+  """Random forest of BinaryTreeClassifier trees
+
+  Has the RandomForestClassifier parameters the python models use. The
+  columns are converted once per fit and shared by the trees; bootstrap
+  samples are row weights. With warm_start a refit adds trees up to
+  n_estimators. n_jobs is accepted for compatibility (the trees are grown
+  one after the other with vectorised levels).
+  """
+
+  def __init__(self, n_estimators=100, max_depth=None, min_samples_split=2, min_samples_leaf=1,
+               min_impurity_split=1e-7, max_features='sqrt', bootstrap=True, class_weight=None,
+               random_state=None, warm_start=False, n_jobs=None):
+    self.n_estimators = n_estimators
+    self.max_depth = max_depth
+    self.min_samples_split = min_samples_split
+    self.min_samples_leaf = min_samples_leaf
+    self.min_impurity_split = min_impurity_split
+    self.max_features = max_features
+    self.bootstrap = bootstrap
+    self.class_weight = class_weight
+    self.random_state = random_state
+    self.warm_start = warm_start
+    self.n_jobs = n_jobs
+
+  def fit(self, X, y, sample_weight=None):
+    y, w = _labels(self, y, sample_weight)
+    columns = BinaryColumns(X)
+    if not self.warm_start or not hasattr(self, 'estimators_'):
+      self.estimators_ = []
+      self._rs = np.random.RandomState(self.random_state)
+    self.n_features_ = columns.shape[1]
+    while len(self.estimators_) < self.n_estimators:
+      tree = BinaryTreeClassifier(max_depth=self.max_depth,
+                                  min_samples_split=self.min_samples_split,
+                                  min_samples_leaf=self.min_samples_leaf,
+                                  min_impurity_split=self.min_impurity_split,
+                                  max_features=self.max_features,
+                                  random_state=self._rs.randint(MAX_INT))
+      tree.classes_, tree.n_classes_ = self.classes_, self.n_classes_
+      rs = np.random.RandomState(tree.random_state)
+      tree_w = w
+      if self.bootstrap:
+        tree_w = w * np.bincount(rs.randint(0, y.shape[0], y.shape[0]), minlength=y.shape[0])
+      self.estimators_.append(tree._fit_columns(columns, y, tree_w, rs))
+    del self.estimators_[self.n_estimators:]
+    return self
+
+  @property
+  def feature_importances_(self):
+    importance = np.mean([tree.feature_importances_ for tree in self.estimators_], axis=0)
+    total = importance.sum()
+    return importance / total if total > 0 else importance
+
+  def apply(self, X):
+    columns = X if isinstance(X, BinaryColumns) else BinaryColumns(X)
+    return np.column_stack([tree.apply(columns) for tree in self.estimators_])
+
+  def predict_proba(self, X):
+    columns = X if isinstance(X, BinaryColumns) else BinaryColumns(X)
+    value = np.zeros(columns.shape[0])
+    for tree in self.estimators_:
+      value += tree.tree_.value[tree.apply(columns)]
+    return _proba(self.classes_, value / len(self.estimators_))
+
+  def predict(self, X):
+    return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+class BinaryAdaBoostClassifier(AdaBoostClassifier):
+  """AdaBoostClassifier of BinaryTreeClassifier stumps
+
+  The boosting is sklearn's; every round refits the stump on the same
+  matrix, so its columns are only converted once (see columns_of). The
+  parameters are the constructor arguments only - the stump and the
+  other AdaBoostClassifier settings are set when it is fitted.
+  """
+
+  def __init__(self, n_estimators=50, learning_rate=1.0, algorithm='SAMME.R', random_state=None):
+    self.n_estimators = n_estimators
+    self.learning_rate = learning_rate
+    self.algorithm = algorithm
+    self.random_state = random_state
+
+  def fit(self, X, y, sample_weight=None):
+    # the AdaBoostClassifier settings (estimator_params...) that are not ours
+    defaults = vars(AdaBoostClassifier())
+    own = self.get_params(deep=False)
+    for name, value in defaults.items():
+      if name not in own:
+        setattr(self, name, value)
+    # the base estimator parameter was renamed (estimator) in sklearn 1.2
+    base = 'estimator' if 'estimator' in defaults else 'base_estimator'
+    setattr(self, base, BinaryTreeClassifier(max_depth=1))
+    return super(BinaryAdaBoostClassifier, self).fit(X, y, sample_weight)
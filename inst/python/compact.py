@@ -0,0 +1,65 @@
+#  compact dtypes for the covariate matrix
+#===============================================================
+# INPUT:
+# 1) the shape and number of non-zero entries of the covariate matrix
+#
+# OUTPUT:
+# int32 csr indices whenever the matrix fits, uint8 values for indicator
+# covariates (float32 otherwise) and float32 upcasts of slices that are
+# handed to an estimator
+#================================================================
+import numpy as np
+from scipy.sparse import issparse, csr_matrix
+
+INT32_MAX = np.iinfo(np.int32).max
+
+
+def index_dtype(*sizes):
+  """int32 when every size (rows, columns, nnz) fits, else int64"""
+  if max(int(s) for s in sizes) < INT32_MAX:
+    return np.int32
+  return np.int64
+
+
+def value_dtype(data):
+  """uint8 for 0-255 integer values (indicators and counts), else float32"""
+  data = np.asarray(data)
+  if data.shape[0] == 0:
+    return np.uint8
+  if data.min() >= 0 and data.max() <= 255 and np.all(np.mod(data, 1) == 0):
+    return np.uint8
+  return np.float32
+
+
+def compact_csr(matrix):
+  """The csr matrix with the narrowest index and value dtypes that hold it"""
+  matrix = csr_matrix(matrix)
+  itype = index_dtype(matrix.shape[0], matrix.shape[1], matrix.nnz)
+  return csr_matrix((matrix.data.astype(value_dtype(matrix.data), copy=False),
+                     matrix.indices.astype(itype, copy=False),
+                     matrix.indptr.astype(itype, copy=False)),
+                    shape=matrix.shape, copy=False)
+
+
+def nbytes(matrix):
+  """Memory used by the arrays of a sparse or dense matrix"""
+  if issparse(matrix):
+    return matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+  return np.asarray(matrix).nbytes
+
+
+def as_float(X, dtype=np.float32):
+  """X with floating point values for an estimator
+
+  Compact (integer valued) matrices are upcast here, at the slice that is
+  fitted or scored, so the stored matrix and the fold copies stay narrow.
+  Only the value array is converted - sparse indices are shared.
+  """
+  if issparse(X):
+    if np.issubdtype(X.dtype, np.floating):
+      return X
+    X = csr_matrix(X)
+    return csr_matrix((X.data.astype(dtype), X.indices, X.indptr), shape=X.shape, copy=False)
+  if np.issubdtype(np.asarray(X).dtype, np.floating):
+    return X
+  return np.asarray(X, dtype=dtype)
@@ -0,0 +1,402 @@
+#  cross validation fold executor shared by the python trainers
+#===============================================================
+# INPUT:
+# 1) X (rows aligned with population) and population
+#    (rowIdPython, outcomeCount, ..., indexes)
+# 2) an estimator class, its parameters, the seed and the number of workers
+#
+# OUTPUT:
+# prediction: population rows with index > 0 merged with the out of fold
+# prediction (same layout the R side reads)
+#
+# the training rows are copied once into fold order (see fold_layout) so
+# every fold is sliced from contiguous row blocks
+#================================================================
+from __future__ import print_function
+import os
+import sys
+import shutil
+import tempfile
+import timeit
+import multiprocessing
+import numpy as np
+from scipy.sparse import issparse
+from sparse_store import save_csr, load_csr
+from fold_layout import FoldLayout
+from compact import as_float
+from spans import SpanRecorder, spans, span
+from negative_sampling import single_outcome_fraction, negative_sample, recalibrate
+from cv_journal import CvJournal, data_key, unit_key
+
+# data shared with the worker processes (set once per worker)
+_shared = {}
+
+
+def fold_seed(seed, fold):
+  """Deterministic seed for a fold (None stays None)"""
+  if seed is None:
+    return None
+  return int(seed) + int(fold)
+
+
+def train_folds(population):
+  """The fold of each training row (rows with index > 0)"""
+  index = population[:, population.shape[1]-1]
+  return index[index > 0].astype(np.int64)
+
+
+def _python_executable():
+  # embedded python (PythonInR) reports the R executable
+  exe = sys.executable
+  if os.path.basename(exe).lower().startswith('python'):
+    return exe
+  for name in ('python.exe', 'python', os.path.join('bin', 'python')):
+    candidate = os.path.join(sys.exec_prefix, name)
+    if os.path.isfile(candidate):
+      return candidate
+  return exe
+
+
+def _share(X, location):
+  """Write X to a memory-mappable location for the workers"""
+  if issparse(X):
+    save_csr(X, location)
+  else:
+    os.makedirs(location)
+    np.save(os.path.join(location, 'dense.npy'), np.asarray(X))
+  return location
+
+
+def _open(location):
+  dense = os.path.join(location, 'dense.npy')
+  if os.path.exists(dense):
+    return np.load(dense, mmap_mode='r')
+  return load_csr(location)
+
+
+def _init_worker(location, y, layout, memory=False, sampling=None):
+  _shared['X'] = _open(location)
+  _shared['y'] = y
+  _shared['layout'] = layout
+  _shared['memory'] = memory
+  _shared['sampling'] = sampling
+
+
+def _fold_slices(fold, dense, recorder):
+  # the slices of the last fold are kept so consecutive tasks on the
+  # same fold (different grid points) reuse them
+  cached = _shared.get('slices')
+  if cached is None or cached[0] != fold:
+    _shared['slices'] = None
+    X, layout = _shared['X'], _shared['layout']
+    # negative subsampling: only the kept rows of the train set are sliced
+    keep = _shared['sampling'][0] if _shared.get('sampling') else None
+    with recorder.span('cv.slice', fold=fold) as attrs:
+      train_x = layout.train(X, fold, keep)
+      test_x = layout.test(X, fold)
+      train_y = layout.train_values(_shared['y'], fold, keep)
+      # compact (integer valued) matrices are upcast per fold only
+      train_x = as_float(train_x)
+      test_x = as_float(test_x)
+      if dense and issparse(train_x):
+        train_x = train_x.toarray()
+        test_x = test_x.toarray()
+      attrs['rows'] = X.shape[0]
+    cached = (fold, train_x, test_x, train_y)
+    _shared['slices'] = cached
+  return cached[1:]
+
+
+def positive_proba(proba, classes=None):
+  """The predicted probability of class 1 (one column per output of a
+  multi-output estimator, whose predict_proba returns a list) - a model
+  fitted on rows of one class (classes) predicts it with probability 1"""
+  if isinstance(proba, list):
+    return np.column_stack([positive_proba(p, None if classes is None else classes[k])
+                            for k, p in enumerate(proba)])
+  if proba.shape[1] == 1:
+    return np.full(proba.shape[0], float(classes is not None and classes[0] > 0))
+  return proba[:, 1]
+
+
+def stage_groups(grid, stage_param):
+  """Group the grid points that only differ in stage_param
+
+  Returns a list of (params, [(stage value, grid point), ...]) with the
+  stages sorted so one model can be grown through all of them.
+  """
+  groups = []
+  for point, params in enumerate(grid):
+    base = dict((k, v) for k, v in params.items() if k != stage_param)
+    for group in groups:
+      if group[0] == base:
+        group[1].append((params[stage_param], point))
+        break
+    else:
+      groups.append((base, [(params[stage_param], point)]))
+  return [(base, sorted(stages)) for base, stages in groups]
+
+
+def _fit_task(task):
+  fold, stages, estimator, params, seed_param, seed, dense, stage_param = task
+  # spans of a task are returned with its results (it may run in a worker)
+  recorder = SpanRecorder(memory=_shared.get('memory', False))
+  train_x, test_x, train_y = _fold_slices(fold, dense, recorder)
+  params = dict(params)
+  if seed_param is not None:
+    params[seed_param] = fold_seed(seed, fold)
+  results = []
+  ntrain, ntest = int(train_x.shape[0]), int(test_x.shape[0])
+  start_time = timeit.default_timer()
+
+  if stage_param is None:
+    with recorder.span('cv.fit', fold=fold, point=stages[0][1], rows=ntrain):
+      model = estimator(**params)
+      model = model.fit(train_x, train_y)
+    with recorder.span('cv.predict', fold=fold, point=stages[0][1], rows=ntest):
+      pred = positive_proba(model.predict_proba(test_x), getattr(model, 'classes_', None))
+    results.append((stages[0][1], pred, timeit.default_timer() - start_time))
+
+  elif hasattr(estimator, 'staged_predict_proba'):
+    # boosting: fit the largest model once and read the checkpoints from
+    # the staged predictions
+    params[stage_param] = int(stages[-1][0])
+    with recorder.span('cv.fit', fold=fold, point=stages[-1][1], rows=ntrain):
+      model = estimator(**params)
+      model = model.fit(train_x, train_y)
+    fit_time = timeit.default_timer() - start_time
+    remaining = list(stages)
+    pred = None
+    with recorder.span('cv.predict', fold=fold, point=stages[-1][1], rows=ntest):
+      for i, staged in enumerate(model.staged_predict_proba(test_x)):
+        pred = staged[:, 1]
+        while remaining and remaining[0][0] <= i+1:
+          results.append((remaining.pop(0)[1], pred, fit_time))
+    # boosting can stop early - the remaining checkpoints get the final model
+    for value, point in remaining:
+      results.append((point, pred, fit_time))
+
+  else:
+    # forests: grow the same model to each checkpoint with warm_start
+    params['warm_start'] = True
+    model = estimator(**params)
+    for value, point in stages:
+      with recorder.span('cv.fit', fold=fold, point=point, rows=ntrain):
+        model.set_params(**{stage_param: int(value)})
+        model = model.fit(train_x, train_y)
+      with recorder.span('cv.predict', fold=fold, point=point, rows=ntest):
+        pred = positive_proba(model.predict_proba(test_x), getattr(model, 'classes_', None))
+      results.append((point, pred, timeit.default_timer() - start_time))
+
+  if _shared.get('sampling'):
+    fraction = _shared['sampling'][1]
+    results = [(point, recalibrate(pred, fraction), t) for point, pred, t in results]
+  return fold, results, ntrain, ntest, recorder.spans
+
+
+def run_tasks(X, y, layout, tasks, workers=1, sampling=None, done=None):
+  """Run fold tasks in process or in a pool of workers sharing X via memmap
+
+  X and y are in the fold order of layout (see FoldLayout.arrange).
+  sampling is None or the (mask in fold order, fraction) of a negative
+  subsampling: the tasks fit on the kept rows of their train set and
+  recalibrate their predictions. done(i, result) is called as soon as
+  task i finishes (e.g. to journal it).
+  """
+  results = []
+  workers = max(1, min(int(workers or 1), len(tasks)))
+  if workers == 1:
+    _shared.update(X=X, y=y, layout=layout, memory=spans.memory, sampling=sampling)
+    try:
+      for task in tasks:
+        results.append(_fit_task(task))
+        if done is not None:
+          done(len(results) - 1, results[-1])
+      return results
+    finally:
+      _shared.clear()
+
+  location = tempfile.mkdtemp(prefix='plp_cv_')
+  try:
+    with span('cv.share', rows=X.shape[0]):
+      _share(X, os.path.join(location, 'X'))
+    if sys.platform == 'win32':
+      multiprocessing.set_executable(_python_executable())
+    pool = multiprocessing.Pool(workers, _init_worker,
+                                (os.path.join(location, 'X'), y, layout, spans.memory, sampling))
+    try:
+      # tasks are ordered by fold so each worker mostly reuses one fold slice
+      for result in pool.imap(_fit_task, tasks):
+        results.append(result)
+        if done is not None:
+          done(len(results) - 1, results[-1])
+      return results
+    finally:
+      pool.close()
+      pool.join()
+  finally:
+    shutil.rmtree(location, ignore_errors=True)
+
+
+def cross_validate_grid(X, y, folds, estimator, grid, seed=None, seed_param='random_state',
+                        workers=1, dense=False, quiet=True, warm_start=None, rows=None,
+                        multi_output=False, negative_fraction=None, journal=None, data_id=None):
+  """Out of fold predictions of every grid point for the rows of X
+
+  y and folds are restricted to the training rows and grid is a list of
+  parameter dicts. X is either restricted too or rows gives the training
+  rows of X. The training rows are copied once in fold order, so the test
+  set of a fold is a view and its train set the blocks around it; the
+  fold slices are made once per fold and shared by all grid points. With
+  more than one worker the tasks run in a process pool; X is written once
+  to a memory-mapped store that every worker opens, so the matrix is
+  never pickled per task.
+
+  warm_start names a parameter (e.g. n_estimators) that is grown
+  incrementally: grid points that only differ in it share one model per
+  fold that is scored at each requested value (staged predictions for
+  boosting, warm_start for forests).
+
+  y can hold one column per outcome of the same rows: the outcomes then
+  share the fold layout and the arranged rows. With multi_output one
+  estimator per task is fitted on all of them (forests and trees accept
+  a label matrix), otherwise the tasks run once per outcome.
+
+  negative_fraction (in (0, 1], None or 1 keeps every row) fits the
+  models on every outcome row and that fraction of the other rows of
+  each fold (see negative_sampling) and recalibrates their predictions
+  (not with multi_output: see single_outcome_fraction).
+
+  journal is a directory where every finished (fold, grid point group)
+  fit is recorded (see cv_journal): a rerun on the same rows, outcomes,
+  folds and settings reads those fits back and only runs the others.
+  The fits of an estimator with a seed parameter are only journaled when
+  seed is set (otherwise a rerun would not reproduce them). data_id keys
+  X in the journal (see plp_models.matrix_id: the rows and columns of the
+  covariate matrix of the journal directory X was sliced from) - X is
+  hashed when it is None.
+
+  Returns a (grid points x rows) prediction array - (grid points x rows x
+  outcomes) for a y matrix - and the training time per (grid point, fold)
+  (per (grid point, fold, outcome) when the outcomes are fitted apart).
+  """
+  layout = FoldLayout(folds)
+  fold_ids = [int(f) for f in layout.fold_ids]
+  if warm_start is None:
+    groups = [(params, [(None, p)]) for p, params in enumerate(grid)]
+  else:
+    groups = stage_groups(grid, warm_start)
+  tasks = [(f, stages, estimator, params, seed_param, seed, dense, warm_start)
+           for f in fold_ids for params, stages in groups]
+  y = np.asarray(y)
+  test_pred = np.zeros((len(grid), layout.n) + y.shape[1:])
+  fit_times = {}
+  ordered_y = y[layout.order]
+  with span('cv.arrange', rows=layout.n):
+    ordered_x = layout.arrange(X, rows)
+  if y.ndim == 1 or multi_output:
+    runs = [(None, ordered_y)]
+  else:
+    runs = [(k, ordered_y[:, k]) for k in range(y.shape[1])]
+  fraction = single_outcome_fraction(negative_fraction, multi_output and y.ndim > 1)
+  if journal and (seed is not None or seed_param is None):
+    with span('cv.journal', rows=layout.n):
+      ordered_folds = np.asarray(folds)[layout.order]
+      if data_id is None:
+        key = data_key(ordered_x, ordered_y, ordered_folds)
+      else:
+        key = unit_key(data_id, data_key(ordered_y, ordered_folds,
+                                         np.arange(0) if rows is None else np.asarray(rows)))
+      journal = CvJournal(journal, key)
+  else:
+    journal = None
+  for outcome, run_y in runs:
+    sampling = None
+    if fraction is not None:
+      keep = negative_sample(run_y, np.asarray(folds)[layout.order], fraction, seed=seed)
+      sampling = (keep, fraction)
+    finished, missing, units = _journaled(journal, tasks, estimator, fraction, outcome,
+                                          multi_output)
+    done = None
+    if journal is not None:
+      done = lambda i, result: _journal(journal, units[i], result)
+    if finished and not quiet:
+      print("Resuming: %s of %s fold fits read from the journal" % (len(finished), len(tasks)))
+    reported = set()
+    for fold, results, n_train, n_test, task_spans in finished + run_tasks(
+        ordered_x, run_y, layout, missing, workers, sampling, done):
+      spans.extend(task_spans)
+      if not quiet and fold not in reported:
+        reported.add(fold)
+        print("Fold %s split %s in train set and %s in test set" % (fold, n_train, n_test))
+      for point, pred, fit_time in results:
+        if outcome is None:
+          test_pred[point, layout.positions(fold)] = pred
+          fit_times[(point, fold)] = fit_time
+        else:
+          test_pred[point, layout.positions(fold), outcome] = pred
+          fit_times[(point, fold, outcome)] = fit_time
+        if not quiet:
+          print("Training fold took: %.2f s" % (fit_time))
+          print("Mean: %s prediction value" % (np.mean(pred)))
+  return test_pred, fit_times
+
+
+def _journaled(journal, tasks, estimator, fraction, outcome, multi_output):
+  """The task results read from the journal, the tasks still to run and
+  their journal units"""
+  finished, missing, units = [], [], []
+  for task in tasks:
+    fold, stages, _, params, seed_param, seed, dense, stage_param = task
+    # the threads a fit uses (n_jobs) do not change its predictions
+    unit = unit_key(estimator.__module__, estimator.__name__,
+                    sorted(item for item in params.items() if item[0] != 'n_jobs'),
+                    [value for value, point in stages], fold, seed_param, seed, dense,
+                    stage_param, fraction, outcome, multi_output)
+    saved = None if journal is None else journal.load(unit)
+    if saved is None:
+      missing.append(task)
+      units.append(unit)
+      continue
+    results = [(point, pred, float(fit_time))
+               for (value, point), pred, fit_time in zip(stages, saved['pred'], saved['fit_time'])]
+    finished.append((fold, results, int(saved['n_train']), int(saved['n_test']), []))
+  return finished, missing, units
+
+
+def _journal(journal, unit, result):
+  fold, results, n_train, n_test, task_spans = result
+  journal.save(unit, pred=np.array([pred for point, pred, fit_time in results]),
+               fit_time=np.array([fit_time for point, pred, fit_time in results]),
+               n_train=n_train, n_test=n_test)
+
+
+def cross_validate(X, y, folds, estimator, params, seed=None, seed_param='random_state',
+                   workers=1, dense=False, quiet=True, rows=None):
+  """Out of fold predictions for the rows of X (a single parameter setting)
+
+  Returns the prediction vector and the per fold training times.
+  """
+  test_pred, fit_times = cross_validate_grid(X, y, folds, estimator, [params], seed=seed,
+                                             seed_param=seed_param, workers=workers,
+                                             dense=dense, quiet=quiet, rows=rows)
+  return test_pred[0], dict((fold, t) for (point, fold), t in fit_times.items())
+
+
+def cv_predict(X, population, estimator, params, seed=None, seed_param='random_state',
+               workers=1, dense=False, quiet=True):
+  """Run cross validation on the population rows with index > 0
+
+  X has one row per population row. Returns the prediction matrix:
+  population[index > 0, :] with the out of fold prediction appended.
+  """
+  trainInds = population[:, population.shape[1]-1] > 0
+  y = population[trainInds, 1]
+  folds = train_folds(population)
+  if not quiet:
+    print("Calculating prediction for train set of size %s" % (int(np.sum(trainInds))))
+  test_pred, fold_times = cross_validate(X, y, folds, estimator, params,
+                                         seed=seed, seed_param=seed_param, workers=workers,
+                                         dense=dense, quiet=quiet, rows=np.where(trainInds)[0])
+  test_pred.shape = (int(np.sum(trainInds)), 1)
+  return np.append(population[trainInds, :], test_pred, axis=1)
@@ -0,0 +1,84 @@
+#  on-disk journal of finished cross validation units
+#===============================================================
+# INPUT:
+# 1) a journal directory and the key of the data (see data_key)
+# 2) the finished units of a run: the (fold, grid point group) fits of
+#    the cross validation and the variable importance screens
+#
+# OUTPUT:
+# the results of the units an earlier (interrupted) run finished, so a
+# rerun only computes the missing ones
+#
+# a unit is keyed by the data (the rows and columns of the covariate
+# matrix of the journal directory, or a hash of the arranged matrix, and
+# the outcomes and folds), the numpy/sklearn versions, the estimator and
+# its parameters, the fold and the seed (runs without a seed are not
+# journaled). Its
+# arrays (out of fold predictions and timings) are written to one .npz
+# file as soon as it finishes - to a temporary file that is renamed, so
+# a crash never leaves half a unit behind
+#================================================================
+import os
+import hashlib
+import numpy as np
+import sklearn
+from scipy.sparse import issparse
+
+
+def data_key(*arrays):
+  """md5 of arrays (sparse matrices by their data, indices and indptr)
+
+  The numpy and sklearn versions are part of the key, so an upgrade
+  starts a new journal instead of reusing the old fits.
+  """
+  md5 = hashlib.md5()
+  md5.update(repr((np.__version__, sklearn.__version__)).encode())
+  for a in arrays:
+    md5.update(repr(a.shape).encode())
+    for part in ([a.data, a.indices, a.indptr] if issparse(a) else [a]):
+      part = np.ascontiguousarray(part)
+      md5.update(part.dtype.str.encode())
+      md5.update(part.data)
+  return md5.hexdigest()
+
+
+def unit_key(*parts):
+  """md5 of the repr of the parts (settings, fold, seed...) of a unit"""
+  return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+class CvJournal(object):
+  """The finished units of one data key under a journal directory"""
+
+  def __init__(self, location, key):
+    self.location = os.path.join(os.path.abspath(location), key)
+
+  def _path(self, unit):
+    return os.path.join(self.location, unit + '.npz')
+
+  def load(self, unit):
+    """The arrays of a finished unit (None when it is not journaled)"""
+    path = self._path(unit)
+    if not os.path.exists(path):
+      return None
+    try:
+      saved = np.load(path)
+      try:
+        return dict((name, saved[name]) for name in saved.files)
+      finally:
+        saved.close()
+    except (IOError, ValueError):
+      # an unreadable unit is computed again
+      return None
+
+  def save(self, unit, **arrays):
+    """Journal the arrays of a finished unit"""
+    if not os.path.exists(self.location):
+      os.makedirs(self.location)
+    path = self._path(unit)
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+      np.savez(f, **arrays)
+    if os.path.exists(path):
+      os.remove(path)
+    os.rename(temporary, path)
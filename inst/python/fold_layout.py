@@ -0,0 +1,79 @@
+#  fold-contiguous row layout for cross validation
+#===============================================================
+# INPUT:
+# 1) the fold of each training row (and optionally their rows in X)
+#
+# OUTPUT:
+# X with its rows ordered by fold (each fold one contiguous block) and the
+# fold offsets - test sets are views of a block and train sets are the
+# rows around it, so no fold needs fancy indexing
+#================================================================
+import numpy as np
+from scipy.sparse import issparse, csr_matrix
+
+
+class FoldLayout(object):
+  """Row order that makes every fold a contiguous block
+
+  order[i] is the original (training) row stored at position i and the
+  rows of fold fold_ids[k] are positions starts[k]:ends[k].
+  """
+
+  def __init__(self, folds):
+    folds = np.asarray(folds).ravel()
+    # a stable sort keeps the original row order inside each fold
+    self.order = np.argsort(folds, kind='mergesort')
+    self.fold_ids, counts = np.unique(folds, return_counts=True)
+    self.ends = np.cumsum(counts)
+    self.starts = self.ends - counts
+    self.n = folds.shape[0]
+
+  def bounds(self, fold):
+    k = int(np.searchsorted(self.fold_ids, fold))
+    if k >= self.fold_ids.shape[0] or self.fold_ids[k] != fold:
+      raise ValueError('Unknown fold %s' % fold)
+    return int(self.starts[k]), int(self.ends[k])
+
+  def arrange(self, X, rows=None):
+    """X (or X[rows]) in fold order - the only row copy of the fit"""
+    index = self.order if rows is None else np.asarray(rows).ravel()[self.order]
+    if issparse(X):
+      return csr_matrix(X)[index, :]
+    return np.asarray(X)[index]
+
+  def test(self, X, fold):
+    """The rows of fold in an arranged X (a view, nothing is copied)"""
+    start, end = self.bounds(fold)
+    if not issparse(X):
+      return X[start:end]
+    lo, hi = X.indptr[start], X.indptr[end]
+    return csr_matrix((X.data[lo:hi], X.indices[lo:hi], X.indptr[start:end+1] - lo),
+                      shape=(end - start, X.shape[1]), copy=False)
+
+  def train(self, X, fold, keep=None):
+    """The rows outside fold in an arranged X (the two blocks around it) -
+    only those where keep (a mask in fold order) is True when given"""
+    start, end = self.bounds(fold)
+    if keep is not None:
+      index = np.where(keep)[0]
+      index = index[(index < start) | (index >= end)]
+      return csr_matrix(X)[index, :] if issparse(X) else np.asarray(X)[index]
+    if not issparse(X):
+      return np.concatenate([X[:start], X[end:]])
+    lo, hi = X.indptr[start], X.indptr[end]
+    indptr = np.concatenate([X.indptr[:start], X.indptr[end:] - (hi - lo)])
+    return csr_matrix((np.concatenate([X.data[:lo], X.data[hi:]]),
+                       np.concatenate([X.indices[:lo], X.indices[hi:]]), indptr),
+                      shape=(self.n - (end - start), X.shape[1]), copy=False)
+
+  def train_values(self, values, fold, keep=None):
+    """train() for a vector already in fold order"""
+    start, end = self.bounds(fold)
+    if keep is not None:
+      return np.concatenate([values[:start][keep[:start]], values[end:][keep[end:]]])
+    return np.concatenate([values[:start], values[end:]])
+
+  def positions(self, fold):
+    """The original rows of fold (where its test predictions belong)"""
+    start, end = self.bounds(fold)
+    return self.order[start:end]
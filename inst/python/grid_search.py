@@ -0,0 +1,61 @@
+#  hyper-parameter grid search in a single python call
+#===============================================================
+# INPUT:
+# 1) X (rows aligned with population) and population
+#    (rowIdPython, outcomeCount, ..., indexes)
+# 2) an estimator class and a list of parameter dicts (the grid)
+#
+# OUTPUT:
+# the cross validation AUC of every grid point, the best grid point and
+# its out of fold prediction (population columns + value)
+#================================================================
+from __future__ import print_function
+import numpy as np
+from cv_engine import cross_validate_grid, train_folds
+from metrics import auc
+
+
+def best_point(cv_auc):
+  """The index of the grid point with the highest cross validation AUC
+
+  Raises a ValueError when no grid point has an AUC (every fold
+  prediction had rows of one class only).
+  """
+  cv_auc = np.asarray(cv_auc, dtype=np.float64)
+  if np.all(np.isnan(cv_auc)):
+    raise ValueError('The cross validation AUC of every grid point is NaN - the training rows '
+                     'need both outcome classes (too few outcomes for the number of folds?)')
+  return int(np.nanargmax(cv_auc))
+
+
+def grid_search(X, population, estimator, grid, seed=None, seed_param='random_state',
+                workers=1, dense=False, quiet=True, warm_start=None, negative_fraction=None,
+                journal=None, data_id=None):
+  """Cross validate every grid point and keep the best one
+
+  The fold slices are made once and reused by all grid points, and the
+  (fold, grid point) fits run in parallel when workers > 1. Only the AUC
+  of each grid point and the prediction of the best one are returned.
+  warm_start names a parameter (e.g. n_estimators) whose values are
+  reached by growing one model per fold (see cross_validate_grid), and
+  negative_fraction subsamples the rows without the outcome and the fold
+  fits are recorded in (and resumed from) the journal directory, where
+  data_id keys X (see cross_validate_grid).
+  """
+  trainInds = population[:, population.shape[1]-1] > 0
+  y = population[trainInds, 1]
+  test_pred, fit_times = cross_validate_grid(X, y, train_folds(population),
+                                             estimator, grid, seed=seed,
+                                             seed_param=seed_param, workers=workers,
+                                             dense=dense, quiet=quiet,
+                                             warm_start=warm_start,
+                                             rows=np.where(trainInds)[0],
+                                             negative_fraction=negative_fraction,
+                                             journal=journal, data_id=data_id)
+  cv_auc = np.array([auc(y, pred) for pred in test_pred])
+  best = best_point(cv_auc)
+  if not quiet:
+    for point, params in enumerate(grid):
+      print("Grid point %s %s obtained AUC of %.4f" % (point+1, params, cv_auc[point]))
+  prediction = np.append(population[trainInds, :], test_pred[best].reshape(-1, 1), axis=1)
+  return cv_auc, best, prediction
@@ -0,0 +1,197 @@
+#  evaluation metrics computed on the python side
+#===============================================================
+# INPUT:
+# 1) the outcome labels and the predicted risk
+# 2) optionally a number of histogram bins for very large predictions
+#
+# OUTPUT:
+# the metric values (vectorised numpy, no loops over rows): AUC with its
+# 95% confidence interval, Brier score, average precision, the threshold
+# summary counts and the calibration strata that evaluatePlp reports
+#
+# the predictions are sorted once into a tally (the distinct values with
+# their outcome and non-outcome counts) and every metric is computed from
+# the tally, so the cost is O(n log n) once and then O(distinct values).
+# With bins the tally is a fixed-size histogram built in O(n) - ties
+# within a bin make the ranking metrics approximate to about 1/bins
+#================================================================
+import numpy as np
+from scipy.stats import rankdata
+
+THRESHOLD_PROBS = np.arange(100) / 100.0
+
+
+def auc(y, pred):
+  """Area under the ROC curve (Mann-Whitney statistic, ties count a half)"""
+  y = np.asarray(y).ravel() > 0
+  pred = np.asarray(pred, dtype=np.float64).ravel()
+  n_pos = float(np.sum(y))
+  n_neg = float(y.shape[0]) - n_pos
+  if n_pos == 0 or n_neg == 0:
+    return np.nan
+  ranks = rankdata(pred)
+  return (np.sum(ranks[y]) - n_pos * (n_pos + 1) / 2.0) / (n_pos * n_neg)
+
+
+class Tally(object):
+  """Distinct predicted values (ascending) with their outcome counts
+
+  values are the distinct predictions (the mean prediction of each
+  non-empty bin when bins is given), pos and neg the number of rows with
+  and without the outcome at each value and first the outcome of the
+  first row (in data order) at each value.
+  """
+
+  def __init__(self, y, pred, bins=None):
+    y = np.asarray(y).ravel() > 0
+    pred = np.asarray(pred, dtype=np.float64).ravel()
+    if bins:
+      index = np.clip((pred * bins).astype(np.int64), 0, bins - 1)
+      count = np.bincount(index, minlength=bins)
+      keep = count > 0
+      self.values = (np.bincount(index, weights=pred, minlength=bins)[keep] /
+                     count[keep])
+    else:
+      self.values, index = np.unique(pred, return_inverse=True)
+      count = np.bincount(index)
+      keep = slice(None)
+    self.pos = np.bincount(index, weights=y, minlength=count.shape[0])[keep]
+    self.first = y[np.unique(index, return_index=True)[1]].astype(np.float64)
+    self.count = count[keep].astype(np.float64)
+    self.neg = self.count - self.pos
+    self.n = float(pred.shape[0])
+    self.P = float(np.sum(self.pos))
+    self.N = self.n - self.P
+
+  def quantile(self, probs, values=None):
+    """Quantiles of the predictions (R's default type 7 interpolation) -
+    values replaces the predictions by a monotone transform of them"""
+    h = (self.n - 1) * np.asarray(probs, dtype=np.float64)
+    return self.interpolate(h, values)
+
+  def interpolate(self, h, values=None):
+    """The prediction at (fractional, 0 based) order statistic h"""
+    lo = np.floor(h)
+    below = self.order_stat(lo, values)
+    return below + (h - lo) * (self.order_stat(np.ceil(h), values) - below)
+
+  def order_stat(self, k, values=None):
+    """The k-th smallest prediction (0 based)"""
+    values = self.values if values is None else values
+    return values[np.searchsorted(np.cumsum(self.count), k, side='right')]
+
+  def ranked_through(self, threshold):
+    """Outcome and non-outcome counts of the rows ranked (by decreasing
+    prediction, ties in data order) down to the first row predicted at or
+    below threshold - the counts of the R getThresholdSummary, which
+    compares the values rounded to 10 digits"""
+    values = np.round(self.values, 10)
+    last = np.searchsorted(values, np.round(threshold, 10), side='right') - 1
+    last = np.maximum(last, 0)
+    pos = np.concatenate([np.cumsum(self.pos[::-1])[::-1], [0]])
+    neg = np.concatenate([np.cumsum(self.neg[::-1])[::-1], [0]])
+    return (pos[last + 1] + self.first[last],
+            neg[last + 1] + 1 - self.first[last])
+
+
+def auc_ci(tally):
+  """AUC with the 95% confidence interval of the R aucWithCi (DeLong variance)"""
+  if tally.P == 0 or tally.N == 0:
+    return np.nan, np.nan, np.nan
+  # the kernel mean of each case against all controls, and of each control
+  # against all cases - identical for all rows with the same value
+  case = (np.cumsum(tally.neg) - 0.5 * tally.neg) / tally.N
+  control = (tally.P - np.cumsum(tally.pos) + 0.5 * tally.pos) / tally.P
+  mean = np.sum(tally.pos * case) / tally.P
+  s10 = np.sum(tally.pos * (case - mean) ** 2) / max(tally.P - 1, 1)
+  s01 = np.sum(tally.neg * (control - mean) ** 2) / max(tally.N - 1, 1)
+  sd = np.sqrt(s10 / tally.P + s01 / tally.N)
+  return mean, mean - 1.96 * sd, mean + 1.96 * sd
+
+
+def brier(y, pred):
+  """Brier score and the scaled Brier score (as the R brierScore)"""
+  y = np.asarray(y, dtype=np.float64).ravel()
+  pred = np.asarray(pred, dtype=np.float64).ravel()
+  score = np.mean((y - pred) ** 2)
+  mean = np.mean(pred)
+  return score, 1 - score / (mean * (1 - mean))
+
+
+def average_precision(tally):
+  """Mean precision at the rank of each outcome (tied rows share the
+  precision at the end of their tie)"""
+  if tally.P == 0:
+    return np.nan
+  tp = np.cumsum(tally.pos[::-1])
+  ranked = np.cumsum(tally.count[::-1])
+  return np.sum(tally.pos[::-1] * tp / ranked) / tally.P
+
+
+def preference_score(pred, proportion):
+  """The prediction relative to the outcome proportion (0.5 = average risk)"""
+  pred = np.where(pred == 1, 0.99999999, pred)
+  with np.errstate(divide='ignore'):
+    x = np.exp(np.log(pred / (1 - pred)) - np.log(proportion / (1 - proportion)))
+  return x / (x + 1)
+
+
+def threshold_summary(tally, probs=THRESHOLD_PROBS):
+  """Confusion counts at the percentiles of the prediction
+
+  Returns the prediction and preference score thresholds with the true and
+  false positive counts of the R getThresholdSummary (see ranked_through),
+  which derives the rates from these.
+  """
+  thresholds = tally.quantile(probs)
+  # the preference score is monotone in the prediction so its quantiles
+  # come from the same order statistics
+  preference = preference_score(tally.values, tally.P / tally.n)
+  tp, fp = tally.ranked_through(thresholds)
+  return dict(predictionThreshold=thresholds,
+              preferenceThreshold=tally.quantile(probs, preference),
+              truePositiveCount=tp, falsePositiveCount=fp)
+
+
+def calibration(tally, strata=10, truncate_fraction=0.01):
+  """Calibration summary of the prediction deciles (as the R getCalibration)
+
+  The strata are the intervals between the quantiles of the prediction;
+  each has its lower threshold, size, outcome count and the mean, sd and
+  quartiles of its predictions.
+  """
+  q = np.unique(tally.quantile(np.arange(1, strata) / float(strata)))
+  stratum = np.searchsorted(q, tally.values, side='left')
+  size = np.bincount(stratum, weights=tally.count, minlength=q.shape[0] + 1)
+  used = np.where(size > 0)[0]
+  size = size[used]
+  outcomes = np.bincount(stratum, weights=tally.pos, minlength=q.shape[0] + 1)[used]
+  mean = np.bincount(stratum, weights=tally.count * tally.values,
+                     minlength=q.shape[0] + 1)[used] / size
+  position = np.searchsorted(used, stratum)
+  squares = np.bincount(stratum, weights=tally.count * (tally.values - mean[position]) ** 2,
+                        minlength=q.shape[0] + 1)[used]
+  with np.errstate(invalid='ignore', divide='ignore'):
+    sd = np.sqrt(squares / (size - 1))
+  # the quartiles of each stratum are order statistics of the whole tally
+  start = np.concatenate([[0], np.cumsum(size)[:-1]])
+  quartiles = [tally.interpolate(start + (size - 1) * prob) for prob in (0, 0.25, 0.5, 0.75, 1)]
+  return dict(predictionThreshold=np.concatenate([[0], q])[used],
+              PersonCountAtRisk=size, PersonCountWithOutcome=outcomes,
+              averagePredictedProbability=mean, StDevPredictedProbability=sd,
+              MinPredictedProbability=quartiles[0], P25PredictedProbability=quartiles[1],
+              MedianPredictedProbability=quartiles[2], P75PredictedProbability=quartiles[3],
+              MaxPredictedProbability=quartiles[4], observedIncidence=outcomes / size,
+              lims=tally.quantile([truncate_fraction, 1 - truncate_fraction]))
+
+
+def summary(y, pred, strata=10, truncate_fraction=0.01, bins=None):
+  """Every metric of evaluatePlp from one sort (or one histogram) of pred"""
+  tally = Tally(y, pred, bins=bins)
+  brier_score, brier_scaled = brier(y, pred)
+  return dict(auc=auc_ci(tally), brier=brier_score, brier_scaled=brier_scaled,
+              average_precision=average_precision(tally),
+              threshold_summary=threshold_summary(tally),
+              calibration=calibration(tally, strata=strata,
+                                      truncate_fraction=truncate_fraction),
+              population_size=tally.n, outcome_count=tally.P)
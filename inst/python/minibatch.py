@@ -0,0 +1,129 @@
+#  streaming (minibatch) training of estimators with partial_fit
+#===============================================================
+# INPUT:
+# 1) the covariate matrix (e.g. the memory-mapped plpData store), the
+#    rows of it to train on and their labels
+# 2) an estimator with partial_fit (e.g. MLPClassifier), the batch size,
+#    the epoch budget and the early stopping settings
+#
+# OUTPUT:
+# the fitted estimator of the epoch with the lowest validation log loss
+# and the loss history; the out of fold prediction for the cross
+# validation (population rows with index > 0 merged with the prediction)
+#
+# only one minibatch of rows is materialised at a time: the rows are
+# shuffled every epoch and each batch is read from the matrix in row
+# order, so a memory-mapped matrix is read (mostly) sequentially
+#================================================================
+from __future__ import print_function
+import copy
+import timeit
+import numpy as np
+from compact import as_float
+from spans import span
+
+
+def minibatches(X, rows, batch_size, rs=None):
+  """Yield (batch rows, csr batch) - shuffled when rs is given"""
+  rows = np.asarray(rows, dtype=np.int64)
+  if rs is not None:
+    rows = rows[rs.permutation(rows.shape[0])]
+  for start in range(0, rows.shape[0], batch_size):
+    batch = np.sort(rows[start:start+batch_size])
+    yield batch, as_float(X[batch, :], np.float64)
+
+
+def predict_rows(model, X, rows, batch_size=10000):
+  """The predicted probability of class 1 for rows of X, scored in batches"""
+  rows = np.asarray(rows, dtype=np.int64)
+  pred = np.empty(rows.shape[0])
+  for start in range(0, rows.shape[0], batch_size):
+    batch = rows[start:start+batch_size]
+    pred[start:start+batch.shape[0]] = model.predict_proba(as_float(X[batch, :], np.float64))[:, 1]
+  return pred
+
+
+def log_loss(y, pred):
+  pred = np.clip(pred, 1e-15, 1 - 1e-15)
+  return -np.mean(y * np.log(pred) + (1 - y) * np.log(1 - pred))
+
+
+def validation_split(y, fraction, rs):
+  """Stratified held out positions (of y) for early stopping"""
+  held_out = []
+  for outcome in np.unique(y):
+    members = np.where(y == outcome)[0]
+    n = int(round(fraction * members.shape[0]))
+    held_out.append(rs.choice(members, min(n, members.shape[0] - 1), replace=False))
+  held_out = np.sort(np.concatenate(held_out))
+  return np.setdiff1d(np.arange(y.shape[0]), held_out), held_out
+
+
+def fit_stream(model, X, rows, y, batch_size=1000, max_epochs=50, validation_fraction=0.1,
+               patience=3, tol=1e-4, seed=None, quiet=True):
+  """Train model with partial_fit on shuffled minibatches of X[rows]
+
+  y holds the labels of rows. A stratified validation_fraction of the
+  rows is held out; training stops after patience epochs without the
+  validation log loss improving by tol (or after max_epochs) and the
+  model of the best epoch is returned with the per-epoch losses.
+  """
+  rows = np.asarray(rows, dtype=np.int64)
+  y = np.asarray(y, dtype=np.float64)
+  classes = np.unique(y)
+  rs = np.random.RandomState(seed)
+  train, valid = validation_split(y, validation_fraction, rs) if validation_fraction > 0 else \
+    (np.arange(rows.shape[0]), np.array([], dtype=np.int64))
+  # the rows are kept sorted so the labels of a batch are found by position
+  order = np.argsort(rows[train], kind='mergesort')
+  train_rows, train_y = rows[train][order], y[train][order]
+
+  best, best_loss, waited, history = None, np.inf, 0, []
+  for epoch in range(max_epochs):
+    start_time = timeit.default_timer()
+    for batch, batch_x in minibatches(X, train_rows, batch_size, rs):
+      model.partial_fit(batch_x, train_y[np.searchsorted(train_rows, batch)], classes=classes)
+    if valid.shape[0] > 0:
+      loss = log_loss(y[valid], predict_rows(model, X, rows[valid]))
+    else:
+      loss = getattr(model, 'loss_', np.nan)
+    history.append(loss)
+    if not quiet:
+      print("Epoch %s: validation loss %.5f (%.2f s)" % (epoch + 1, loss,
+                                                         timeit.default_timer() - start_time))
+    if best is None or loss < best_loss - tol:
+      best, best_loss, waited = copy.deepcopy(model), loss, 0
+    else:
+      waited += 1
+      if waited >= patience:
+        break
+  return best, history
+
+
+def stream_cv_predict(X, population, estimator, params, seed=None, seed_param='random_state',
+                      quiet=True, **stream):
+  """Out of fold prediction of a streamed estimator
+
+  X is indexed by the population rowIdPython column (no copy of the
+  population rows is made). stream holds the fit_stream settings.
+  Returns population[index > 0, :] with the prediction appended.
+  """
+  index = population[:, population.shape[1]-1]
+  trainInds = index > 0
+  rows = population[trainInds, 0].astype(np.int64)
+  y = population[trainInds, 1]
+  folds = index[trainInds].astype(np.int64)
+  test_pred = np.zeros(rows.shape[0])
+  for i, fold in enumerate(np.unique(folds)):
+    fold_params = dict(params)
+    if seed is not None:
+      fold_params[seed_param] = int(seed) + int(fold)
+    test = folds == fold
+    with span('cv.fit', fold=int(fold), point=0, rows=int(np.sum(~test))):
+      model, history = fit_stream(estimator(**fold_params), X, rows[~test], y[~test],
+                                  seed=fold_params.get(seed_param), quiet=quiet, **stream)
+    with span('cv.predict', fold=int(fold), point=0, rows=int(np.sum(test))):
+      test_pred[test] = predict_rows(model, X, rows[test])
+    if not quiet:
+      print("Fold %s trained for %s epochs" % (fold, len(history)))
+  return np.append(population[trainInds, :], test_pred.reshape(-1, 1), axis=1)
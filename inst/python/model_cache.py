@@ -0,0 +1,142 @@
+#  in-process cache of loaded python models
+#===============================================================
+# INPUT:
+# 1) the path of a pickled model (see model_store)
+#
+# OUTPUT:
+# the loaded model - repeated loads of an unchanged file are served from
+# memory (least recently used models are evicted above the memory budget)
+#================================================================
+import os
+import mmap
+from collections import OrderedDict
+import numpy as np
+from scipy.sparse import issparse
+from model_store import load_artefact
+
+
+def memory_mapped(array):
+  """True if array (or the array it is a view of) is mapped from a file"""
+  while array is not None:
+    if isinstance(array, (np.memmap, mmap.mmap)):
+      return True
+    array = getattr(array, 'base', None)
+  return False
+
+
+def array_bytes(model):
+  """Bytes of the numpy arrays a loaded model holds in memory and of those
+  memory-mapped from its artefact (uncompressed artefacts, see
+  model_store)
+
+  Walks the attributes, containers and pickled state (sklearn's cython
+  trees) of the model; every array is counted once.
+  """
+  # the objects are kept so their ids are not reused while walking
+  seen = {}
+  todo = [model]
+  total = 0
+  mapped = 0
+  while todo:
+    obj = todo.pop()
+    if id(obj) in seen:
+      continue
+    seen[id(obj)] = obj
+    if isinstance(obj, np.ndarray):
+      if obj.dtype == object:
+        todo.extend(obj.ravel())
+      elif memory_mapped(obj):
+        mapped += obj.nbytes
+      else:
+        total += obj.nbytes
+    elif issparse(obj):
+      todo.extend([obj.data, getattr(obj, 'indices', None), getattr(obj, 'indptr', None)])
+    elif isinstance(obj, dict):
+      todo.extend(obj.values())
+    elif isinstance(obj, (list, tuple, set)):
+      todo.extend(obj)
+    elif hasattr(obj, '__dict__'):
+      todo.append(vars(obj))
+    elif hasattr(obj, '__getstate__'):
+      try:
+        state = obj.__getstate__()
+      except TypeError:
+        continue
+      if isinstance(state, dict):
+        todo.append(state)
+  return total, mapped
+
+
+def model_bytes(model):
+  """Bytes of the numpy arrays a loaded model holds in memory - the pages
+  of memory-mapped arrays are read on use and can be dropped by the OS,
+  so they are not counted (see array_bytes)"""
+  return array_bytes(model)[0]
+
+
+class ModelCache(object):
+  """LRU cache of deserialised models keyed by path, mtime and size
+
+  The size of a model in memory is the size of its arrays (model_bytes) -
+  the file size underestimates compressed artefacts and memory-mapped
+  arrays are not counted (they are not held in memory). Models are
+  evicted least recently used first once the total exceeds max_bytes (the
+  model just loaded is always kept).
+  """
+
+  def __init__(self, max_bytes=2*1024**3):
+    self.max_bytes = max_bytes
+    self.models = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+
+  def _key(self, path):
+    path = os.path.abspath(path)
+    info = os.stat(path)
+    return path, info.st_mtime, info.st_size
+
+  def get(self, path, loader=load_artefact):
+    key = self._key(path)
+    if key in self.models:
+      self.hits += 1
+      entry = self.models.pop(key)
+      self.models[key] = entry
+      return entry[0]
+    self.misses += 1
+    # a changed file replaces the stale entry
+    self.invalidate(path)
+    model = loader(path)
+    # models without arrays count by their file size
+    resident, mapped = array_bytes(model)
+    self.models[key] = (model, resident if resident or mapped else key[2])
+    self._evict()
+    return model
+
+  def _evict(self):
+    while len(self.models) > 1 and self.size() > self.max_bytes:
+      self.models.popitem(last=False)
+
+  def size(self):
+    return sum(entry[1] for entry in self.models.values())
+
+  def invalidate(self, path=None):
+    """Drop one model (any version of the file) or the whole cache"""
+    if path is None:
+      self.models.clear()
+      return
+    path = os.path.abspath(path)
+    for key in [key for key in self.models if key[0] == path]:
+      del self.models[key]
+
+
+model_cache = ModelCache()
+
+
+def load_model(path):
+  """Load a pickled model through the session cache"""
+  return model_cache.get(path)
+
+
+def invalidate(path=None):
+  """Remove a model (or every model when path is None) from the session cache"""
+  model_cache.invalidate(path)
@@ -0,0 +1,82 @@
+#  model artefacts of the python models
+#===============================================================
+# INPUT:
+# 1) a fitted model and its model location (a directory)
+# 2) the compression level (0 = none)
+#
+# OUTPUT:
+# location/model.pkl and location/model_meta.json (format, compression,
+# size and save time of the artefact); load_artefact reads a model back
+#
+# an uncompressed artefact keeps the large numpy arrays of the model
+# as raw blocks of the pickle that are memory-mapped when it is loaded
+# (pages are read when they are used); a compressed one (zlib, level
+# 1-9 - 1 is the fast one) is smaller to write and copy but is read in
+# full. The paths are built with os.path so the artefacts written on
+# any platform are found on the others
+#================================================================
+import os
+import json
+import timeit
+from spans import record
+
+try:
+  from sklearn.externals import joblib
+except ImportError:
+  import joblib
+
+MODEL_FILE = 'model.pkl'
+META_FILE = 'model_meta.json'
+
+
+def model_path(location):
+  """The model.pkl of a model location
+
+  Models saved before the paths were portable are found too (outside
+  Windows they were written next to the location as 'location\\model.pkl').
+  """
+  path = os.path.join(location, MODEL_FILE)
+  legacy = location + '\\' + MODEL_FILE
+  if not os.path.exists(path) and os.path.exists(legacy):
+    return legacy
+  return path
+
+
+def read_meta(location):
+  """The metadata of the artefact of a model location ({} when it has none)"""
+  path = os.path.join(location, META_FILE)
+  if not os.path.exists(path):
+    return {}
+  with open(path) as f:
+    return json.load(f)
+
+
+def save_artefact(model, location, compress=0):
+  """Write model to location/model.pkl with its metadata
+
+  Returns the metadata: the format, the compression level, the size of
+  the artefact in bytes and the seconds the save took.
+  """
+  compress = int(compress or 0)
+  if not 0 <= compress <= 9:
+    raise ValueError('The compression level must be in 0-9, not %s' % compress)
+  start_time = timeit.default_timer()
+  if not os.path.exists(location):
+    os.makedirs(location)
+  path = os.path.join(location, MODEL_FILE)
+  joblib.dump(model, path, compress=('zlib', compress) if compress else 0)
+  meta = dict(format='joblib', compress=compress, memmap=compress == 0,
+              bytes=os.path.getsize(path), save_seconds=timeit.default_timer() - start_time)
+  with open(os.path.join(location, META_FILE), 'w') as f:
+    json.dump(meta, f)
+  return meta
+
+
+def load_artefact(path):
+  """Load a model.pkl - memory-mapped when it is not compressed"""
+  start_time = timeit.default_timer()
+  meta = read_meta(os.path.dirname(path))
+  # artefacts without metadata may be compressed (they are read in full)
+  model = joblib.load(path, mmap_mode='r' if meta.get('memmap') else None)
+  record('load_artefact', timeit.default_timer() - start_time, bytes=os.path.getsize(path))
+  return model
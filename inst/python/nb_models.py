@@ -0,0 +1,61 @@
+#  naive bayes models that train on the sparse covariate matrix
+#===============================================================
+# INPUT:
+# 1) nb_type: gaussian, bernoulli or multinomial
+#
+# OUTPUT:
+# the estimator class and its parameters (bernoulli and multinomial use the
+# csr matrix directly, gaussian gathers its statistics chunk by chunk)
+#================================================================
+import numpy as np
+from scipy.sparse import issparse
+
+
+class ChunkedGaussianNB(object):
+  """GaussianNB fitted and applied on dense row chunks of a sparse matrix
+
+  The per class means and variances are accumulated with partial_fit one
+  chunk at a time, so only chunk_bytes of dense data exist at once.
+  """
+
+  def __init__(self, chunk_bytes=256*1024*1024):
+    self.chunk_bytes = chunk_bytes
+
+  def _chunks(self, X):
+    rows = max(1, int(self.chunk_bytes // (8 * max(X.shape[1], 1))))
+    for start in range(0, X.shape[0], rows):
+      chunk = X[start:start+rows]
+      if issparse(chunk):
+        chunk = chunk.toarray()
+      yield start, chunk
+
+  def fit(self, X, y):
+    from sklearn.naive_bayes import GaussianNB
+    y = np.asarray(y)
+    self.classes_ = np.unique(y)
+    self.model_ = GaussianNB()
+    for start, chunk in self._chunks(X):
+      self.model_.partial_fit(chunk, y[start:start+chunk.shape[0]], classes=self.classes_)
+    return self
+
+  def predict_proba(self, X):
+    pred = np.empty((X.shape[0], self.classes_.shape[0]))
+    for start, chunk in self._chunks(X):
+      pred[start:start+chunk.shape[0]] = self.model_.predict_proba(chunk)
+    return pred
+
+  def predict(self, X):
+    return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def nb_estimator(nb_type='gaussian'):
+  """The estimator class and parameters for a naive bayes type"""
+  if nb_type == 'gaussian':
+    return ChunkedGaussianNB, {}
+  if nb_type == 'bernoulli':
+    from sklearn.naive_bayes import BernoulliNB
+    return BernoulliNB, dict(binarize=0.0)
+  if nb_type == 'multinomial':
+    from sklearn.naive_bayes import MultinomialNB
+    return MultinomialNB, {}
+  raise ValueError('Unknown naive bayes type %s' % nb_type)
@@ -0,0 +1,88 @@
+#  negative subsampling of rare outcomes with probability recalibration
+#===============================================================
+# INPUT:
+# 1) the outcome (0/1) and fold of each training row
+# 2) the fraction of the rows without the outcome that is kept
+#
+# OUTPUT:
+# the mask of the rows a model is fitted on (every outcome row and the
+# fraction of the other rows of each fold) and the predictions of that
+# model corrected back to the full population
+#
+# keeping a fraction r of the negatives multiplies the odds the model
+# learns by 1/r, so the odds of its predictions are multiplied by r:
+# p = r q / (r q + 1 - q) - the calibration of the predictions (and the
+# AUC, the correction is monotone) is that of a model fitted on all rows
+#================================================================
+import numpy as np
+
+
+def sampling_fraction(fraction):
+  """The fraction of negatives to keep - None when every row is kept"""
+  if fraction is None:
+    return None
+  fraction = float(fraction)
+  if not 0 < fraction <= 1:
+    raise ValueError('The negative fraction must be in (0, 1], not %s' % fraction)
+  return None if fraction == 1 else fraction
+
+
+def single_outcome_fraction(fraction, multi_output):
+  """sampling_fraction of a fit that may be on several outcomes at once
+
+  A fit on a label matrix keeps every row with any of the outcomes, so
+  the negatives of one outcome that have another one are not sampled
+  with fraction and its predictions cannot be recalibrated - subsampling
+  is refused for those fits.
+  """
+  fraction = sampling_fraction(fraction)
+  if multi_output and fraction is not None:
+    raise ValueError('Negative subsampling is not available for multi output fits - '
+                     'set the negative fraction to 1 or fit the outcomes apart')
+  return fraction
+
+
+def negative_sample(y, folds, fraction, seed=None):
+  """The rows to fit on: all rows with the outcome and round(fraction * n)
+  of the n rows without it in every fold"""
+  y = np.asarray(y)
+  positive = (y.reshape(y.shape[0], -1) > 0).any(axis=1)
+  folds = np.asarray(folds).ravel()
+  keep = positive.copy()
+  rs = np.random.RandomState(seed)
+  for fold in np.unique(folds):
+    negatives = np.where((folds == fold) & ~positive)[0]
+    size = int(round(fraction * negatives.shape[0]))
+    keep[rs.choice(negatives, size, replace=False)] = True
+  return keep
+
+
+def recalibrate(proba, fraction):
+  """Predicted probabilities of a model fitted on negatives kept with
+  fraction, corrected to the population they were sampled from"""
+  proba = np.asarray(proba, dtype=np.float64)
+  return fraction * proba / (fraction * proba + 1 - proba)
+
+
+class Recalibrated(object):
+  """A model fitted on negatives kept with fraction
+
+  predict_proba is that of the model with the class 1 probability
+  recalibrated; other attributes are those of the model.
+  """
+
+  def __init__(self, model, fraction):
+    self.model = model
+    self.fraction = fraction
+
+  def predict_proba(self, X):
+    proba = np.array(self.model.predict_proba(X), dtype=np.float64)
+    proba[:, 1] = recalibrate(proba[:, 1], self.fraction)
+    proba[:, 0] = 1 - proba[:, 1]
+    return proba
+
+  def __getattr__(self, name):
+    # special methods (e.g. the pickle protocol) are not delegated
+    if name.startswith('__') or name in ('model', 'fraction'):
+      raise AttributeError(name)
+    return getattr(self.model, name)
@@ -0,0 +1,547 @@
+#  importable entry points of the python models
+#===============================================================
+# INPUT:
+# 1) plpData (the covariate matrix), population (rowIdPython,
+#    outcomeCount, indexes) and the included columns
+# 2) the model name (randomForest, adaBoost, decisionTree, mlp) and its
+#    settings as the R side names them
+#
+# OUTPUT:
+# train_cv: the cv AUC of every grid point, the best grid point and its
+# out of fold prediction; train_final: the fitted model (saved with its
+# flattened trees to model_output, see model_store); predict: the
+# prediction of the population
+# (variable_importance_outcomes, train_cv_outcomes and train_final_outcomes
+# do the same for several outcomes of one covariate matrix)
+#
+# the R fitters import this module once per session and call these
+# functions - the inputs are arguments and the intermediate matrices are
+# released when the call returns (nothing is left in the __main__
+# globals); sklearn is imported the first time a model needs it
+#================================================================
+from __future__ import print_function
+import os
+import timeit
+import numpy as np
+from spans import record, span
+from negative_sampling import sampling_fraction, single_outcome_fraction, negative_sample, Recalibrated
+
+# settings that differ only in this parameter share one model per fold
+WARM_START = {'randomForest': 'n_estimators', 'adaBoost': 'n_estimators'}
+TREE_MODELS = ('randomForest', 'adaBoost', 'decisionTree')
+# models that can be fitted on several outcomes at once (a label matrix)
+MULTI_OUTPUT = ('randomForest', 'decisionTree')
+# the estimators of the tree models on binary covariates (engine='binary')
+BINARY_ESTIMATORS = {'randomForest': 'BinaryForestClassifier',
+                     'adaBoost': 'BinaryAdaBoostClassifier',
+                     'decisionTree': 'BinaryTreeClassifier'}
+_estimators = {}
+
+
+def estimator(name):
+  """The sklearn estimator class of a model (imported on first use)"""
+  if name not in _estimators:
+    if name == 'randomForest':
+      from sklearn.ensemble import RandomForestClassifier as cls
+    elif name == 'adaBoost':
+      from sklearn.ensemble import AdaBoostClassifier as cls
+    elif name == 'decisionTree':
+      from sklearn.tree import DecisionTreeClassifier as cls
+    elif name == 'mlp':
+      from sklearn.neural_network import MLPClassifier as cls
+    else:
+      raise ValueError('Unknown model %s' % name)
+    _estimators[name] = cls
+  return _estimators[name]
+
+
+def engine_estimator(name, engine='sklearn', X=None):
+  """The estimator class fitting a model with a tree engine: 'sklearn' or
+  'binary' (binary_trees, used for the tree models when every value of X
+  is 0/1 - sklearn otherwise)"""
+  if engine not in ('sklearn', 'binary'):
+    raise ValueError('Unknown tree engine %s' % engine)
+  if engine == 'binary' and name in BINARY_ESTIMATORS and X is not None:
+    import binary_trees
+    if binary_trees.is_binary(X):
+      return getattr(binary_trees, BINARY_ESTIMATORS[name])
+  return estimator(name)
+
+
+def engine_params(name, cls, params):
+  """params restricted to the ones cls accepts when it is not the sklearn
+  estimator of the model (the binary engine has no criterion, presort...)"""
+  if cls is estimator(name):
+    return params
+  names = cls().get_params(deep=False)
+  return dict((k, v) for k, v in params.items() if k in names)
+
+
+def estimator_params(name, settings, ncol, workers=1):
+  """The estimator parameters of the R settings of a model
+
+  workers is the number of processes the cross validation runs in - a
+  forest only grows its trees in parallel when it is fitted in process.
+  """
+  if name == 'randomForest':
+    mtry = int(settings.get('mtry', -1))
+    if mtry == -1:
+      mtry = int(np.round(np.sqrt(ncol)))
+    return dict(max_features=mtry, n_estimators=int(settings['ntrees']),
+                max_depth=int(settings['max_depth']), min_samples_split=5,
+                n_jobs=-1 if int(workers or 1) <= 1 else 1, bootstrap=False)
+  if name == 'adaBoost':
+    return dict(n_estimators=int(settings['n_estimators']),
+                learning_rate=float(settings['learning_rate']), algorithm='SAMME.R')
+  if name == 'decisionTree':
+    return dict(criterion='gini', splitter='best', max_depth=int(settings['max_depth']),
+                min_samples_split=int(settings['min_samples_split']),
+                min_samples_leaf=int(settings['min_samples_leaf']),
+                min_weight_fraction_leaf=0.0, max_features=None, max_leaf_nodes=None,
+                min_impurity_split=float(settings['min_impurity_split']),
+                class_weight=settings.get('class_weight'), presort=False)
+  if name == 'mlp':
+    return dict(activation='logistic', alpha=float(settings['alpha']), learning_rate='adaptive',
+                hidden_layer_sizes=(int(settings['size']), 2))
+  raise ValueError('Unknown model %s' % name)
+
+
+def population_matrix(plpData, population, included=None, train_only=False):
+  """The rows of plpData in population order (only the training rows with
+  train_only), restricted to the included columns"""
+  rows = population[:, 0]
+  if train_only:
+    rows = rows[population[:, population.shape[1]-1] > 0]
+  X = plpData[rows.astype(np.int64), :]
+  if included is not None:
+    X = X[:, np.asarray(included).flatten().astype(np.int64)]
+  return X
+
+
+def matrix_id(plpData, rows, included=None):
+  """Journal key of the matrix of the rows and included columns of
+  plpData - the journal directory is that of one covariate matrix (the R
+  pythonJournal is keyed by its covariate hash), so the sliced matrix is
+  not hashed"""
+  from cv_journal import data_key
+  columns = np.arange(0) if included is None else np.asarray(included).ravel()
+  return data_key(np.asarray(plpData.shape, dtype=np.int64), np.asarray(rows, dtype=np.float64),
+                  columns.astype(np.int64))
+
+
+def save_model(model, model_output, probe=None, compress=0):
+  """Save model to model_output (model.pkl and its metadata, compressed
+  with the zlib level compress - see model_store) with its flattened trees
+  when it is a tree model and probe rows are given to check them"""
+  from model_store import model_path, save_artefact
+  from model_cache import invalidate
+  start_time = timeit.default_timer()
+  # a cached (memory-mapped) model of the location is released before it is replaced
+  invalidate(model_path(model_output))
+  meta = save_artefact(model, model_output, compress=compress)
+  if probe is not None:
+    # flattened trees next to model.pkl (memory-mapped, vectorised scoring)
+    from tree_engine import export_trees
+    export_trees(model, model_output, probe=probe)
+  record('serialise', timeit.default_timer()-start_time, bytes=meta['bytes'])
+
+
+def variable_importance(plpData, population, method='forest', quiet=True, journal=None):
+  """The importance of every column on the training rows (see var_screen)
+
+  With a journal directory (of the covariate matrix plpData, see
+  matrix_id) the importance is recorded there and read back by a rerun
+  on the same rows and outcomes.
+  """
+  trainInds = population[:, population.shape[1]-1] > 0
+  X = population_matrix(plpData, population, train_only=True)
+  y = population[trainInds, 1]
+  return screen_columns(X, y, method, quiet, journal,
+                        data_id=matrix_id(plpData, population[trainInds, 0]) if journal else None)
+
+
+def screen_columns(X, y, method='forest', quiet=True, journal=None, data_id=None):
+  """The importance of every column of X for y (an outcome or a label
+  matrix) and the seconds it took, journaled (see variable_importance) -
+  data_id keys X in the journal (X is hashed when it is None)"""
+  from var_screen import screen, select
+  if not quiet:
+    print("Train set contains %s outcomes " % (np.sum(y)))
+    print("Applying variable importance feature selection...")
+  saved = None
+  if journal:
+    from cv_journal import CvJournal, data_key, unit_key
+    key = data_key(X, y) if data_id is None else unit_key(data_id, data_key(y))
+    journal, unit = CvJournal(journal, key), unit_key('var_imp', method, 0)
+    saved = journal.load(unit)
+  if saved is None:
+    var_imp, var_imp_time = screen(X, y, method=method, seed=0)
+    if journal:
+      journal.save(unit, var_imp=var_imp, var_imp_time=var_imp_time)
+  else:
+    var_imp, var_imp_time = saved['var_imp'], float(saved['var_imp_time'])
+    if not quiet:
+      print("Variable importance read from the journal")
+  record('var_imp', var_imp_time, rows=X.shape[0], outcomes=1 if y.ndim == 1 else y.shape[1])
+  if not quiet:
+    print("Selected %s number of features in %.2f s" % (select(var_imp).shape[0], var_imp_time))
+  return var_imp, var_imp_time
+
+
+def train_cv(name, plpData, population, grid, included=None, seed=None, workers=1,
+             quiet=True, stream=None, engine='sklearn', negative_fraction=None, journal=None):
+  """Cross validate the grid (a list of R settings) of a model
+
+  Returns the cv AUC of every grid point, the index of the best one and
+  its out of fold prediction (population rows with index > 0 merged with
+  the prediction). stream holds the minibatch settings of a streamed mlp
+  (see minibatch.fit_stream) - the rows are then read from plpData
+  batch by batch instead of being copied. engine is the tree engine (see
+  engine_estimator). negative_fraction keeps every outcome row and that
+  fraction of the other rows of each fold to fit on (the predictions are
+  recalibrated, see negative_sampling). journal is a directory of the
+  covariate matrix plpData (see matrix_id) where the finished fold fits
+  are recorded, so a rerun resumes from them (see
+  cv_engine.cross_validate_grid).
+  """
+  from grid_search import grid_search, best_point
+  cls = estimator(name)
+  if stream and sampling_fraction(negative_fraction) is not None:
+    raise ValueError('Negative subsampling is not available for streamed training')
+  if stream:
+    from minibatch import stream_cv_predict
+    from metrics import auc
+    predictions = [stream_cv_predict(plpData, population, cls,
+                                     estimator_params(name, settings, plpData.shape[1]),
+                                     seed=seed, quiet=quiet, **stream) for settings in grid]
+    cv_auc = np.array([auc(p[:, 1], p[:, p.shape[1]-1]) for p in predictions])
+    best = best_point(cv_auc)
+    return cv_auc, best, predictions[best]
+  X = population_matrix(plpData, population, included)
+  cls = engine_estimator(name, engine, X)
+  params = [engine_params(name, cls, estimator_params(name, settings, X.shape[1], workers))
+            for settings in grid]
+  return grid_search(X, population, cls, params, seed=seed, workers=workers, quiet=quiet,
+                     warm_start=WARM_START.get(name), negative_fraction=negative_fraction,
+                     journal=journal,
+                     data_id=matrix_id(plpData, population[:, 0], included) if journal else None)
+
+
+def final_estimator(name, settings, ncol, seed=None, cls=None):
+  """The unfitted estimator (of class cls, the sklearn one by default) of
+  the final model"""
+  cls = cls or estimator(name)
+  params = estimator_params(name, settings, ncol)
+  if name == 'mlp':
+    params['tol'] = 0.0000001
+  return cls(random_state=seed, **engine_params(name, cls, params))
+
+
+def train_final(name, plpData, population, settings, model_output, included=None, seed=None,
+                quiet=True, stream=None, engine='sklearn', negative_fraction=None, compress=0):
+  """Fit a model on all the training rows and save it to model_output
+
+  With negative_fraction the model is fitted on every outcome row and
+  that fraction of the other rows of each fold, and saved as a
+  Recalibrated model. compress is the compression level of the saved
+  model (see save_model).
+  """
+  trainInds = population[:, population.shape[1]-1] > 0
+  fit_rows = population[trainInds, :]
+  fraction = sampling_fraction(negative_fraction)
+  if fraction is not None:
+    # only the kept rows are sliced from plpData
+    from cv_engine import train_folds
+    fit_rows = fit_rows[negative_sample(fit_rows[:, 1], train_folds(population), fraction,
+                                        seed=seed)]
+  y = fit_rows[:, 1]
+  ncol = plpData.shape[1] if included is None else np.asarray(included).size
+  X = None if stream else population_matrix(plpData, fit_rows, included)
+  model = final_estimator(name, settings, ncol, seed, cls=engine_estimator(name, engine, X))
+  if not quiet:
+    print("Training final %s model on %s rows..." % (name, fit_rows.shape[0]))
+
+  start_time = timeit.default_timer()
+  if stream:
+    from minibatch import fit_stream
+    model, history = fit_stream(model, plpData, fit_rows[:, 0], y, seed=seed,
+                                quiet=quiet, **stream)
+  else:
+    model = model.fit(X, y)
+  end_time = timeit.default_timer()
+  record('final.fit', end_time-start_time, rows=int(fit_rows.shape[0]))
+  if fraction is not None:
+    model = Recalibrated(model, fraction)
+  if not quiet:
+    print("Training final took: %.2f s" % (end_time-start_time))
+    print("Model saved to: %s" % (model_output))
+  probe = X[:1000] if name in TREE_MODELS and X is not None else None
+  save_model(model, model_output, probe=probe, compress=compress)
+  return model
+
+
+class OutcomeModel(object):
+  """One outcome of a model fitted on several outcomes at once
+
+  Scores like a single outcome model (predict_proba has the two columns
+  of that outcome); other attributes are those of the shared model.
+  """
+
+  def __init__(self, model, output):
+    self.model = model
+    self.output = output
+
+  def predict_proba(self, X):
+    return self.model.predict_proba(X)[self.output]
+
+  def __getattr__(self, name):
+    # special methods (e.g. the pickle protocol) are not delegated
+    if name.startswith('__') or name in ('model', 'output'):
+      raise AttributeError(name)
+    return getattr(self.model, name)
+
+
+def shared_folds(populations, included=None):
+  """Group the populations with the same rows and folds
+
+  Returns lists of positions in populations; the populations of a group
+  only differ in their outcome (e.g. several outcomes of one target
+  cohort split with the same seed). included (one column array or None
+  per population) splits the groups by their included columns too.
+  """
+  included = outcome_included(included, len(populations))
+  groups = []
+  for i, population in enumerate(populations):
+    layout = population[:, [0, population.shape[1]-1]]
+    for first, columns, members in groups:
+      if (first.shape == layout.shape and np.array_equal(first, layout) and
+          (columns is None) == (included[i] is None) and
+          (columns is None or np.array_equal(columns, included[i]))):
+        members.append(i)
+        break
+    else:
+      groups.append((layout, included[i], [i]))
+  return [members for first, columns, members in groups]
+
+
+def outcome_included(included, count):
+  """The included columns of each of count populations - included is
+  None, the columns of all of them or a list with those of each"""
+  if isinstance(included, list):
+    return included
+  return [included] * count
+
+
+def variable_importance_outcomes(plpData, populations, method='forest', quiet=True,
+                                 journal=None):
+  """variable_importance for several outcomes of the same covariate matrix
+
+  The training rows of the populations with the same rows and folds are
+  sliced once and, with the forest screen, one forest is fitted on all
+  their outcomes (a label matrix); the other screens are run per outcome.
+  Returns a (var_imp, var_imp_time) tuple per population.
+  """
+  results = [None] * len(populations)
+  for members in shared_folds(populations):
+    population = populations[members[0]]
+    trainInds = population[:, population.shape[1]-1] > 0
+    X = population_matrix(plpData, population, train_only=True)
+    Y = np.column_stack([populations[i][trainInds, 1] for i in members])
+    fits = [members] if method == 'forest' and len(members) > 1 else [[i] for i in members]
+    for fit in fits:
+      y = Y[:, [members.index(i) for i in fit]]
+      result = screen_columns(X, y[:, 0] if len(fit) == 1 else y, method, quiet, journal,
+                              data_id=matrix_id(plpData, population[trainInds, 0]) if journal else None)
+      for i in fit:
+        results[i] = result
+  return results
+
+
+def train_cv_outcomes(name, plpData, populations, grid, included=None, seed=None, workers=1,
+                      quiet=True, multi_output=False, engine='sklearn', negative_fraction=None,
+                      journal=None):
+  """train_cv for several outcomes of the same covariate matrix
+
+  populations is a list of populations (rowIdPython, outcomeCount,
+  indexes). The rows of the populations with the same rows and folds are
+  sliced and arranged in fold order once and every outcome of the group
+  is cross validated on them; with multi_output the models that accept a
+  label matrix (MULTI_OUTPUT, sklearn engine) fit all the outcomes of a
+  group together. negative_fraction subsamples the rows without the
+  outcome (not with multi_output, see single_outcome_fraction) and
+  journal records the fold fits (see train_cv). included is the included
+  columns of all the populations or a list with those of each. Returns a
+  (cv_auc, best, prediction) tuple per population.
+  """
+  from cv_engine import cross_validate_grid, train_folds
+  from metrics import auc
+  from grid_search import best_point
+  single_outcome_fraction(negative_fraction, multi_output)
+  included = outcome_included(included, len(populations))
+  results = [None] * len(populations)
+  for members in shared_folds(populations, included):
+    population = populations[members[0]]
+    trainInds = population[:, population.shape[1]-1] > 0
+    Y = np.column_stack([populations[i][trainInds, 1] for i in members])
+    X = population_matrix(plpData, population, included[members[0]])
+    cls = engine_estimator(name, engine, X)
+    params = [engine_params(name, cls, estimator_params(name, settings, X.shape[1], workers))
+              for settings in grid]
+    joint = multi_output and name in MULTI_OUTPUT and len(members) > 1 and cls is estimator(name)
+    if not quiet:
+      print("Cross validating %s outcomes on %s rows%s" % (len(members), int(np.sum(trainInds)),
+                                                           ' (one model)' if joint else ''))
+    test_pred, fit_times = cross_validate_grid(X, Y, train_folds(population), cls, params,
+                                               seed=seed, workers=workers, quiet=quiet,
+                                               warm_start=WARM_START.get(name),
+                                               rows=np.where(trainInds)[0], multi_output=joint,
+                                               negative_fraction=negative_fraction,
+                                               journal=journal,
+                                               data_id=matrix_id(plpData, population[:, 0],
+                                                                 included[members[0]]) if journal else None)
+    for k, i in enumerate(members):
+      cv_auc = np.array([auc(Y[:, k], pred) for pred in test_pred[:, :, k]])
+      best = best_point(cv_auc)
+      prediction = np.append(populations[i][trainInds, :], test_pred[best, :, k].reshape(-1, 1),
+                             axis=1)
+      results[i] = (cv_auc, best, prediction)
+  return results
+
+
+def train_final_outcomes(name, plpData, populations, settings, model_outputs, included=None,
+                         seed=None, quiet=True, multi_output=False, engine='sklearn',
+                         negative_fraction=None, compress=0):
+  """train_final for several outcomes of the same covariate matrix
+
+  settings and model_outputs hold the settings and model location of each
+  population. The training rows of the populations with the same rows
+  and folds are sliced once; with multi_output the outcomes of such a
+  group with the same settings share one model (MULTI_OUTPUT models,
+  sklearn engine only) that is saved for each of them as an OutcomeModel.
+  negative_fraction subsamples the rows without the outcome (not with
+  multi_output, see single_outcome_fraction) and compress is the
+  compression level of the saved models (see train_final). included is
+  as in train_cv_outcomes. Returns the model of each population.
+  """
+  from cv_engine import train_folds
+  fraction = single_outcome_fraction(negative_fraction, multi_output)
+  included = outcome_included(included, len(populations))
+  models = [None] * len(populations)
+  for members in shared_folds(populations, included):
+    population = populations[members[0]]
+    trainInds = population[:, population.shape[1]-1] > 0
+    X = population_matrix(plpData, population, included[members[0]], train_only=True)
+    cls = engine_estimator(name, engine, X)
+    joint = multi_output and name in MULTI_OUTPUT and cls is estimator(name)
+    fits = []
+    for i in members:
+      for fit in fits:
+        if joint and settings[fit[0]] == settings[i]:
+          fit.append(i)
+          break
+      else:
+        fits.append([i])
+    for fit in fits:
+      Y = np.column_stack([populations[i][trainInds, 1] for i in fit])
+      fit_x = X
+      if fraction is not None:
+        keep = negative_sample(Y, train_folds(population), fraction, seed=seed)
+        fit_x, Y = X[np.where(keep)[0]], Y[keep]
+      model = final_estimator(name, settings[fit[0]], X.shape[1], seed, cls=cls)
+      with span('final.fit', rows=int(fit_x.shape[0]), outcomes=len(fit)):
+        model = model.fit(fit_x, Y[:, 0] if len(fit) == 1 else Y)
+      if not quiet:
+        print("Trained final %s model of %s outcomes on %s rows" % (name, len(fit),
+                                                                    fit_x.shape[0]))
+      for k, i in enumerate(fit):
+        # flattened trees are only exported for single outcome models
+        models[i] = model if len(fit) == 1 else OutcomeModel(model, k)
+        if fraction is not None:
+          models[i] = Recalibrated(models[i], fraction)
+        save_model(models[i], model_outputs[i], probe=X[:1000] if name in TREE_MODELS else None,
+                   compress=compress)
+  return models
+
+
+def train_naive_bayes(plpData, population, nb_type, featnum, model_output, workers=1,
+                      quiet=True, compress=0):
+  """Univariate selection, cross validation and final fit of naive bayes
+
+  Returns the fitted model, the fitted SelectKBest (its scores_ are the
+  variable importance), the selected column indices (the included
+  columns to predict with) and the out of fold prediction.
+  """
+  from sklearn.feature_selection import SelectKBest, chi2
+  from cv_engine import cross_validate, train_folds
+  from nb_models import nb_estimator
+  trainInds = population[:, population.shape[1]-1] > 0
+  y = population[trainInds, 1]
+  X = population_matrix(plpData, population, train_only=True)
+
+  start_time = timeit.default_timer()
+  kbest = SelectKBest(chi2, k='all').fit(X, y)
+  record('var_imp', timeit.default_timer()-start_time, rows=X.shape[0])
+  kbest.scores_ = np.nan_to_num(kbest.scores_)
+  featnum = int(featnum)
+  included = np.arange(X.shape[1])
+  if featnum > 0 and featnum < X.shape[1]:
+    threshold = -np.sort(-kbest.scores_)[featnum-1]
+    if not quiet:
+      print("Applying univariate feature selection to select %s features (threshold %s)" % (featnum, threshold))
+    included = np.where(kbest.scores_ >= threshold)[0]
+    X = X[:, included]
+
+  cls, params = nb_estimator(nb_type)
+  test_pred, fold_times = cross_validate(X, y, train_folds(population), cls, params,
+                                         seed_param=None, workers=workers, quiet=quiet)
+
+  start_time = timeit.default_timer()
+  model = cls(**params).fit(X, y)
+  end_time = timeit.default_timer()
+  record('final.fit', end_time-start_time, rows=X.shape[0])
+  if not quiet:
+    print("Training final took: %.2f s" % (end_time-start_time))
+  save_model(model, model_output, compress=compress)
+  prediction = np.append(population[trainInds, :], test_pred.reshape(-1, 1), axis=1)
+  return model, kbest, included, prediction
+
+
+def plot_tree(model, model_output, varnames):
+  """Write the graphviz file of a decision tree next to its model"""
+  from sklearn import tree
+  # the tree of a recalibrated model
+  model = getattr(model, 'model', model)
+  if not isinstance(model, tree.DecisionTreeClassifier):
+    print("The tree plot needs the sklearn tree engine")
+    return
+  tree.export_graphviz(model, out_file=os.path.join(model_output, 'tree_plot.dot'),
+                       feature_names=np.asarray(varnames).flatten())
+
+
+def predict(model_loc, plpData, population, included, dense=False, batch_size=100000, workers=1,
+            model_cache_mb=2048, quiet=True):
+  """The population merged with the predicted risk of a saved model
+
+  The rows are sliced, column selected and densified one batch at a time;
+  repeated calls with an unchanged model reuse the loaded one.
+  """
+  from batch_predict import predict_population
+  from model_cache import model_cache, load_model
+  from model_store import model_path
+  from tree_engine import fast_scorer
+  model_cache.max_bytes = model_cache_mb*1024*1024
+  with span('load_model'):
+    # tree models saved with flattened trees are scored by those when it is faster
+    model = fast_scorer(model_loc, cache=model_cache)
+    if model is None:
+      model = load_model(model_path(model_loc))
+  if not quiet:
+    print("Calculating predictions on population in batches of %s rows..." % (batch_size))
+  with span('predict', rows=population.shape[0]):
+    prediction = predict_population(model, plpData, population,
+                                    included=np.asarray(included).flatten(),
+                                    dense=dense, batch_size=batch_size, workers=workers)
+  if not quiet:
+    print("Prediction complete: %s rows, mean prediction %s" % (
+      prediction.shape[0], np.mean(prediction[:, prediction.shape[1]-1])))
+  return prediction
@@ -0,0 +1,21 @@
+#  bulk transfer of numeric arrays between R and python
+#===============================================================
+# INPUT:
+# 1) .npy files written by the R writeNpy (float64 or int32, column major)
+# 2) arrays (e.g. the prediction matrix) to return to R
+#
+# OUTPUT:
+# .npy files the R readNpy reads with one readBin: float64 values in
+# column major order, so an R matrix is filled without any per-row
+# conversion (the files are ordinary .npy files, readable with np.load)
+#================================================================
+import numpy as np
+
+
+def save_for_r(array, path):
+  """Write array as a float64 column major .npy file for readNpy"""
+  array = np.asarray(array, dtype=np.float64)
+  if array.ndim > 2:
+    raise ValueError('Only vectors and matrices can be returned to R')
+  np.save(path, np.asfortranarray(array))
+  return array.shape
@@ -2,88 +2,22 @@
 #===============================================================
 # INPUT:
 # 1) location of files: libsvm file + indexes file (rowId, index)
-# 2) ntree, max_depth, mtry, var_imp
+# 2) ntrees_grid, max_depth_grid, mtry_grid (one entry per grid point), included
 #
 # OUTPUT:
-# it returns a file with indexes merged with prediction for test index  
+# cv_auc for every grid point, best_index and prediction: the indexes merged
+# with the out of fold prediction of the best grid point
 #================================================================
-import numpy as np
-from collections import OrderedDict
-import os
-import sys
-import timeit
-import math
-from sklearn.ensemble import RandomForestClassifier
-from scipy.sparse import coo_matrix,csr_matrix,vstack,hstack
-from sklearn.feature_selection import SelectFromModel
-#from sklearn.cross_validation import PredefinedSplit
-from sklearn.externals.joblib import Memory
-from sklearn.datasets import load_svmlight_file
-from sklearn.externals import joblib
-
+from plp_models import train_cv
 
 #================================================================
-##ntrees = int(sys.argv[2])
-##max_depth = int(sys.argv[3])
-##mtry = int(sys.argv[4])
-# appear to be redundant in new structure
-##mapping = sys.argv[5] # this contains column selection/ordering 
-##missing = sys.argv[6] # this contains missing
-
-if quiet==False: 
-  print "Training Random Forest with: mtry: %s - max_depth: %s - ntrees: %s " %(mtry, max_depth, ntrees)
-
-if (mtry==-1):
-  mtry =int(np.round(np.sqrt(X.shape[1])))
-
-# load index file
-y = population[:,1]
-X = plpData[population[:,0],:]
-X = X[:,included.flatten()]
 if quiet==False:
-  print "population loaded- %s rows and %s columns" %(np.shape(population)[0], np.shape(population)[1])
+  print("Training Random Forest grid of %s settings" %(ntrees_grid.size))
 
 ###########################################################################
-pred_size = int(np.sum(population[:,population.shape[1]-1] > 0))
-if quiet==False:
-  print "Calculating prediction for train set of size %s" %(pred_size)
-test_pred = np.zeros(pred_size)# zeros length sum(population[:,population.size[1]] ==i)
-for i in range(1, int(np.max(population[:,population.shape[1]-1])+1), 1):
-  testInd =population[:,population.shape[1]-1] ==i
-  trainInd = (population[:,population.shape[1]-1] !=i) & (population[:,population.shape[1]-1] > 0)
-  train_x = X[trainInd,:]
-  train_y = y[trainInd]
-  test_x = X[testInd,:]	
-  
-  if quiet==False:
-    print "Fold %s split %s in train set and %s in test set" %(i, train_x.shape[0], test_x.shape[0])
-    print "Train set contains %s outcomes " %(np.sum(train_y))
-
-    # train on full test data using hyper parameters
-    print "Training user specified random forest..."
-  start_time = timeit.default_timer()	
-  rf = RandomForestClassifier(max_features=int(mtry), n_estimators=ntrees,max_depth=max_depth,min_samples_split=5,  n_jobs=-1, bootstrap=False, random_state=seed)#, class_weight="balanced_subsample")
-  #rf = RandomForestClassifier(max_features=mtry, n_estimators=500,max_depth=4,min_samples_split=5, random_state=0, n_jobs=-1, bootstrap=False)#, class_weight="balanced_subsample")
-  rf = rf.fit(train_x, train_y)
-  end_time = timeit.default_timer()
-  
-  if quiet==False:
-    print "Training fold took: %.2f s" %(end_time-start_time)
-    print "Calculating predictions on left out fold set..."
-  ind = (population[:,population.shape[1]-1] > 0)
-  ind = population[ind,population.shape[1]-1]==i
-  test_pred[ind] = rf.predict_proba(test_x)[:,1]
-  
-  if quiet==False:
-    print "Prediction complete: %s rows " %(np.shape(test_pred[ind])[0])
-    print "Mean: %s prediction value" %(np.mean(test_pred[ind]))
-  
-# get the CV performance
-trainInd = population[:,population.shape[1]-1] > 0
-test_pred.shape = (population[trainInd,:].shape[0], 1)
-prediction = np.append(population[trainInd,:],test_pred, axis=1)
-
-
-	
-
-
+# all grid points are cross validated in this one call - settings that only
+# differ in ntrees share one forest per fold that is grown with warm_start
+grid = [dict(ntrees=ntrees_i, max_depth=max_depth_i, mtry=mtry_i) for ntrees_i, max_depth_i, mtry_i
+        in zip(ntrees_grid.flatten(), max_depth_grid.flatten(), mtry_grid.flatten())]
+cv_auc, best_index, prediction = train_cv('randomForest', plpData, population, grid, included=included,
+                                          seed=seed, workers=workers, quiet=quiet)
@@ -0,0 +1,260 @@
+#  standalone scoring server for saved python plp models
+#===============================================================
+# INPUT:
+# 1) one or more saved python models: name=directory (the python_model
+#    folder written by savePlpModel with model.pkl and model_covariates.csv -
+#    models without model_covariates.csv are refused)
+# 2) POST /predict?model=name with an npz body holding a csr batch:
+#    indptr, indices (covariateIds), data
+#
+# OUTPUT:
+# the risk of every row as an npy float64 vector (or json with format=json)
+# GET /stats reports request counts and p50/p99 latency per model
+#
+# usage: python scoring_server.py --model rf=/path/python_model [--port 8765]
+#================================================================
+from __future__ import print_function
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import deque
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
+
+try:
+  from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+  from SocketServer import ThreadingMixIn
+  from urlparse import urlparse, parse_qs
+  import Queue as queue
+except ImportError:
+  from http.server import BaseHTTPRequestHandler, HTTPServer
+  from socketserver import ThreadingMixIn
+  from urllib.parse import urlparse, parse_qs
+  import queue
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from model_cache import load_model
+from model_store import model_path
+from tree_engine import fast_scorer
+
+
+def read_covariate_map(location):
+  """Sorted covariateIds and their model columns from model_covariates.csv
+
+  Models without the file are refused: the covariateIds of a request
+  cannot be mapped to the model columns without it.
+  """
+  path = os.path.join(location, 'model_covariates.csv')
+  if not os.path.exists(path):
+    raise IOError('%s has no model_covariates.csv - save the model again with savePlpModel' % location)
+  table = np.loadtxt(path, delimiter=',', skiprows=1, ndmin=2)
+  order = np.argsort(table[:, 0])
+  return table[order, 0], table[order, 1].astype(np.int64)
+
+
+def to_model_columns(batch, covariate_map, ncol):
+  """Map the covariateId column indexes of a csr batch to the model columns"""
+  ids, columns = covariate_map
+  indices = np.asarray(batch['indices'], dtype=np.float64)
+  position = np.minimum(np.searchsorted(ids, indices), ids.shape[0]-1)
+  # covariates the model was not trained on are dropped
+  keep = ids[position] == indices
+  columns = columns[position]
+  rows = np.repeat(np.arange(len(batch['indptr'])-1), np.diff(batch['indptr']))
+  matrix = csr_matrix((np.asarray(batch['data'], dtype=np.float64)[keep],
+                       (rows[keep], columns[keep])), shape=(len(batch['indptr'])-1, ncol))
+  matrix.sum_duplicates()
+  return matrix
+
+
+class MicroBatcher(object):
+  """Collects concurrent requests for one model and scores them together
+
+  Requests wait at most max_wait seconds (or until max_rows rows are
+  queued) before the batch is stacked and scored with one predict_proba.
+  """
+
+  def __init__(self, location, max_rows=50000, max_wait=0.005, history=10000):
+    self.location = location
+    self.covariate_map = read_covariate_map(location)
+    self.model = fast_scorer(location)
+    if self.model is None:
+      self.model = load_model(model_path(location))
+    self.ncol = self._ncol()
+    self.dense = type(self.model).__name__ == 'GaussianNB'
+    self.max_rows = max_rows
+    self.max_wait = max_wait
+    self.requests = queue.Queue()
+    self.latency = deque(maxlen=history)
+    self.batches = 0
+    self.rows = 0
+    worker = threading.Thread(target=self._run)
+    worker.daemon = True
+    worker.start()
+
+  def _ncol(self):
+    for attr in ('n_features_in_', 'n_features_', 'n_features'):
+      if hasattr(self.model, attr):
+        return int(getattr(self.model, attr))
+    if hasattr(self.model, 'coefs_'):
+      return int(self.model.coefs_[0].shape[0])
+    if self.covariate_map[1].size:
+      return int(self.covariate_map[1].max()) + 1
+    raise ValueError('Unable to find the number of model columns')
+
+  def score(self, batch):
+    """Score one csr batch (blocks until its micro batch is done)"""
+    start = time.time()
+    item = {'X': to_model_columns(batch, self.covariate_map, self.ncol),
+            'done': threading.Event()}
+    self.requests.put(item)
+    item['done'].wait()
+    self.latency.append(time.time() - start)
+    if 'error' in item:
+      raise item['error']
+    return item['pred']
+
+  def _run(self):
+    while True:
+      items = [self.requests.get()]
+      rows = items[0]['X'].shape[0]
+      deadline = time.time() + self.max_wait
+      while rows < self.max_rows:
+        try:
+          item = self.requests.get(timeout=max(deadline - time.time(), 0))
+        except queue.Empty:
+          break
+        items.append(item)
+        rows += item['X'].shape[0]
+      try:
+        X = vstack([item['X'] for item in items]).tocsr()
+        if self.dense:
+          X = X.toarray()
+        pred = self.model.predict_proba(X)[:, 1]
+        start = 0
+        for item in items:
+          item['pred'] = pred[start:start+item['X'].shape[0]]
+          start += item['X'].shape[0]
+      except Exception as err:
+        for item in items:
+          item['error'] = err
+      self.batches += 1
+      self.rows += rows
+      for item in items:
+        item['done'].set()
+
+  def stats(self):
+    latency = np.array(self.latency) * 1000
+    return {'requests': len(latency), 'batches': self.batches, 'rows': self.rows,
+            'p50_ms': float(np.percentile(latency, 50)) if len(latency) else None,
+            'p99_ms': float(np.percentile(latency, 99)) if len(latency) else None}
+
+
+class ScoringHandler(BaseHTTPRequestHandler):
+
+  def _send(self, code, body, content_type='application/json'):
+    self.send_response(code)
+    self.send_header('Content-Type', content_type)
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def _json(self, code, value):
+    self._send(code, json.dumps(value).encode('utf-8'))
+
+  def do_GET(self):
+    url = urlparse(self.path)
+    if url.path == '/stats':
+      self._json(200, dict((name, b.stats()) for name, b in self.server.batchers.items()))
+    elif url.path == '/models':
+      self._json(200, dict((name, b.location) for name, b in self.server.batchers.items()))
+    else:
+      self._json(404, {'error': 'unknown path %s' % url.path})
+
+  def do_POST(self):
+    url = urlparse(self.path)
+    query = parse_qs(url.query)
+    name = query.get('model', [None])[0]
+    if url.path != '/predict' or name not in self.server.batchers:
+      self._json(404, {'error': 'unknown model %s' % name})
+      return
+    try:
+      body = self.rfile.read(int(self.headers['Content-Length']))
+      batch = np.load(io.BytesIO(body))
+      pred = self.server.batchers[name].score(batch)
+    except Exception as err:
+      self._json(400, {'error': str(err)})
+      return
+    if query.get('format', ['npy'])[0] == 'json':
+      self._json(200, {'value': pred.tolist()})
+    else:
+      out = io.BytesIO()
+      np.save(out, np.asarray(pred, dtype=np.float64))
+      self._send(200, out.getvalue(), 'application/octet-stream')
+
+  def log_message(self, format, *args):
+    if not self.server.quiet:
+      BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class ScoringServer(ThreadingMixIn, HTTPServer):
+  daemon_threads = True
+
+  def __init__(self, models, host='127.0.0.1', port=8765, max_rows=50000, max_wait=0.005,
+               quiet=True):
+    HTTPServer.__init__(self, (host, port), ScoringHandler)
+    self.quiet = quiet
+    self.batchers = dict((name, MicroBatcher(location, max_rows=max_rows, max_wait=max_wait))
+                         for name, location in models.items())
+
+
+def encode_batch(matrix):
+  """npz request body for a csr matrix whose column indexes are covariateIds"""
+  matrix = csr_matrix(matrix)
+  out = io.BytesIO()
+  np.savez(out, indptr=matrix.indptr, indices=matrix.indices, data=matrix.data)
+  return out.getvalue()
+
+
+def request_scores(matrix, model, host='127.0.0.1', port=8765):
+  """Score a csr matrix (covariateId columns) against a running server"""
+  try:
+    from urllib2 import urlopen, Request
+  except ImportError:
+    from urllib.request import urlopen, Request
+  request = Request('http://%s:%s/predict?model=%s' % (host, port, model),
+                    data=encode_batch(matrix),
+                    headers={'Content-Type': 'application/octet-stream'})
+  return np.load(io.BytesIO(urlopen(request).read()))
+
+
+def main(args=None):
+  parser = argparse.ArgumentParser(description='Score saved python plp models over http on localhost')
+  parser.add_argument('--model', action='append', required=True,
+                      help='name=location of a saved python_model folder (repeatable)')
+  parser.add_argument('--host', default='127.0.0.1')
+  parser.add_argument('--port', type=int, default=8765)
+  parser.add_argument('--max-rows', type=int, default=50000,
+                      help='maximum rows scored in one micro batch')
+  parser.add_argument('--max-wait-ms', type=float, default=5.0,
+                      help='time a request waits for others to join its micro batch')
+  parser.add_argument('--verbose', action='store_true')
+  args = parser.parse_args(args)
+  models = dict(m.split('=', 1) for m in args.model)
+  server = ScoringServer(models, host=args.host, port=args.port, max_rows=args.max_rows,
+                         max_wait=args.max_wait_ms / 1000.0, quiet=not args.verbose)
+  print("Scoring %s on http://%s:%s" % (', '.join(sorted(models)), args.host, args.port))
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+
+
+if __name__ == '__main__':
+  main()
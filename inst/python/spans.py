@@ -0,0 +1,91 @@
+#  named timing spans for the python models
+#===============================================================
+# INPUT:
+# 1) code wrapped in span(name, ...) or durations measured elsewhere
+#    (e.g. in a worker process) passed to record(name, seconds, ...)
+#
+# OUTPUT:
+# one list of spans (name, seconds, optional peak memory, fold, grid point,
+# rows, outcomes and artefact bytes) that the R side fetches column by
+# column with spans.column(), and the hooks (add_hook) that receive every
+# span as it closes (for custom logging)
+#================================================================
+import timeit
+from contextlib import contextmanager
+from sparse_builder import peak_rss
+
+# every attribute a span is recorded with (the columns of getPythonSpans)
+COLUMNS = ('name', 'seconds', 'peak_rss_mb', 'fold', 'point', 'rows', 'outcomes', 'bytes')
+
+
+class SpanRecorder(object):
+  """Collects timing spans of one fit or prediction
+
+  With memory=True the peak resident memory of the process is sampled when
+  each span closes. Every hook is called with the span dict as it is
+  recorded; a failing hook never stops the model.
+  """
+
+  def __init__(self, memory=False):
+    self.memory = memory
+    self.hooks = []
+    self.spans = []
+
+  def reset(self, memory=None):
+    self.spans = []
+    if memory is not None:
+      self.memory = memory
+
+  def record(self, name, seconds, **attrs):
+    item = dict(attrs, name=name, seconds=float(seconds))
+    if self.memory and 'peak_rss_mb' not in item:
+      rss = peak_rss()
+      item['peak_rss_mb'] = None if rss is None else rss / 1048576.0
+    self.spans.append(item)
+    for hook in self.hooks:
+      try:
+        hook(item)
+      except Exception:
+        pass
+    return item
+
+  @contextmanager
+  def span(self, name, **attrs):
+    start_time = timeit.default_timer()
+    try:
+      yield attrs
+    finally:
+      self.record(name, timeit.default_timer() - start_time, **attrs)
+
+  def extend(self, spans):
+    """Record spans collected by another recorder (e.g. in a worker)"""
+    for item in spans:
+      item = dict(item)
+      self.record(item.pop('name'), item.pop('seconds'), **item)
+
+  def column(self, key):
+    """One column of the span table (missing numbers are nan)"""
+    if key == 'name':
+      return [str(item['name']) for item in self.spans]
+    return [float('nan') if item.get(key) is None else float(item[key]) for item in self.spans]
+
+  def total(self, name):
+    return sum(item['seconds'] for item in self.spans if item['name'] == name)
+
+
+spans = SpanRecorder()
+
+
+def span(name, **attrs):
+  """Time a block as a named span of the session recorder"""
+  return spans.span(name, **attrs)
+
+
+def record(name, seconds, **attrs):
+  """Add a span measured elsewhere to the session recorder"""
+  return spans.record(name, seconds, **attrs)
+
+
+def add_hook(hook):
+  """Call hook(span) for every span the session recorder closes"""
+  spans.hooks.append(hook)
@@ -0,0 +1,109 @@
+#  single pass CSR builder for the plpData covariate matrix
+#===============================================================
+# INPUT:
+# 1) the shape of the matrix (rows, columns)
+# 2) chunks of (value, row, column) vectors sent from R
+#
+# OUTPUT:
+# a scipy csr_matrix with duplicate entries summed
+#================================================================
+import sys
+import timeit
+import numpy as np
+from scipy.sparse import coo_matrix
+
+try:
+  import resource
+except ImportError:  # not available on windows
+  resource = None
+
+
+def peak_rss():
+  """Peak resident set size of this process in bytes (None if unknown)"""
+  if resource is None:
+    return None
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # mac reports bytes, linux (and the other unixes) kilobytes
+  if sys.platform != 'darwin':
+    peak = peak * 1024
+  return int(peak)
+
+
+class CsrAccumulator(object):
+  """Collects COO chunks into growable arrays and builds one CSR matrix
+
+  The buffers are preallocated to ``capacity`` entries (the number of
+  covariate rows is known in R before the transfer starts) and doubled
+  whenever a chunk does not fit, so ingest is linear in the number of
+  non-zero entries rather than re-summing the matrix for every chunk.
+  """
+
+  def __init__(self, shape, capacity=1024, value_dtype=np.float64,
+               index_dtype=np.int64):
+    self.shape = (int(shape[0]), int(shape[1]))
+    capacity = max(int(capacity), 1)
+    self.data = np.empty(capacity, dtype=value_dtype)
+    self.rows = np.empty(capacity, dtype=index_dtype)
+    self.cols = np.empty(capacity, dtype=index_dtype)
+    self.size = 0
+    self.chunks = 0
+    self.peak_bytes = self._buffer_bytes()
+    self.build_time = 0.0
+    self.nnz = 0
+
+  def _buffer_bytes(self):
+    return self.data.nbytes + self.rows.nbytes + self.cols.nbytes
+
+  def _grow(self, needed):
+    capacity = self.data.shape[0]
+    while capacity < needed:
+      capacity *= 2
+    old_bytes = self._buffer_bytes()
+    for name in ('data', 'rows', 'cols'):
+      old = getattr(self, name)
+      new = np.empty(capacity, dtype=old.dtype)
+      new[:self.size] = old[:self.size]
+      setattr(self, name, new)
+    # both the old and new buffers are alive during the copy
+    self.peak_bytes = max(self.peak_bytes, old_bytes + self._buffer_bytes())
+
+  def add(self, data, rows, cols):
+    """Append a chunk of values with their row and column indexes"""
+    data = np.asarray(data).ravel()
+    rows = np.asarray(rows).ravel()
+    cols = np.asarray(cols).ravel()
+    if not (data.shape[0] == rows.shape[0] == cols.shape[0]):
+      raise ValueError('data, rows and cols must have the same length')
+    n = data.shape[0]
+    if self.size + n > self.data.shape[0]:
+      self._grow(self.size + n)
+    self.data[self.size:self.size + n] = data
+    self.rows[self.size:self.size + n] = rows
+    self.cols[self.size:self.size + n] = cols
+    self.size += n
+    self.chunks += 1
+
+  def tocsr(self):
+    """Build the CSR matrix (duplicate entries are summed) and free the buffers"""
+    start_time = timeit.default_timer()
+    n = self.size
+    matrix = coo_matrix((self.data[:n], (self.rows[:n], self.cols[:n])),
+                        shape=self.shape).tocsr()
+    matrix.sum_duplicates()
+    csr_bytes = matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+    self.peak_bytes = max(self.peak_bytes, self._buffer_bytes() + csr_bytes)
+    self.nnz = matrix.nnz
+    self.data = self.rows = self.cols = None
+    self.build_time = timeit.default_timer() - start_time
+    return matrix
+
+  def report(self):
+    """A one line summary of the conversion for the R logger"""
+    msg = 'Sparse matrix %s x %s built from %s chunks: %s non-zero entries, ' \
+          'peak buffer memory %.1f MB, build %.2f s' % (
+            self.shape[0], self.shape[1], self.chunks, self.nnz,
+            self.peak_bytes / 1048576.0, self.build_time)
+    rss = peak_rss()
+    if rss is not None:
+      msg += ', peak process memory %.1f MB' % (rss / 1048576.0)
+    return msg
@@ -0,0 +1,60 @@
+#  on-disk store for the plpData covariate matrix
+#===============================================================
+# INPUT:
+# 1) a store directory (one per covariate data/covariate map hash)
+#
+# OUTPUT:
+# the csr matrix saved as indptr.npy, indices.npy, data.npy and
+# shape.npy that is reopened memory-mapped (read only, no copy)
+#================================================================
+import os
+import shutil
+import numpy as np
+from scipy.sparse import csr_matrix
+
+STORE_FILES = ('indptr.npy', 'indices.npy', 'data.npy', 'shape.npy')
+
+
+def has_csr(path):
+  """True if a complete store exists at path"""
+  return all(os.path.exists(os.path.join(path, f)) for f in STORE_FILES)
+
+
+def save_csr(matrix, path):
+  """Save a sparse matrix as a csr store at path
+
+  The arrays are written to a temporary directory that is renamed into
+  place, so a crashed or concurrent writer never leaves a partial store.
+  """
+  matrix = csr_matrix(matrix)
+  matrix.sum_duplicates()
+  parent = os.path.dirname(os.path.abspath(path))
+  if not os.path.exists(parent):
+    os.makedirs(parent)
+  temp = '%s.tmp%s' % (path, os.getpid())
+  if os.path.exists(temp):
+    shutil.rmtree(temp)
+  os.makedirs(temp)
+  np.save(os.path.join(temp, 'indptr.npy'), matrix.indptr)
+  np.save(os.path.join(temp, 'indices.npy'), matrix.indices)
+  np.save(os.path.join(temp, 'data.npy'), matrix.data)
+  np.save(os.path.join(temp, 'shape.npy'), np.array(matrix.shape, dtype=np.int64))
+  try:
+    os.rename(temp, path)
+  except OSError:
+    # another process finished the same store first
+    shutil.rmtree(temp)
+    if not has_csr(path):
+      raise
+  return path
+
+
+def load_csr(path, mmap_mode='r'):
+  """Open a csr store without reading the arrays into memory"""
+  if not has_csr(path):
+    raise IOError('No sparse store found at %s' % path)
+  indptr = np.load(os.path.join(path, 'indptr.npy'), mmap_mode=mmap_mode)
+  indices = np.load(os.path.join(path, 'indices.npy'), mmap_mode=mmap_mode)
+  data = np.load(os.path.join(path, 'data.npy'), mmap_mode=mmap_mode)
+  shape = tuple(int(s) for s in np.load(os.path.join(path, 'shape.npy')))
+  return csr_matrix((data, indices, indptr), shape=shape, copy=False)
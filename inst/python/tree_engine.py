@@ -0,0 +1,242 @@
+#  flattened tree ensembles for fast scoring
+#===============================================================
+# INPUT:
+# 1) a fitted DecisionTree, RandomForest or AdaBoost (SAMME/SAMME.R)
+#    classifier and the location of its model.pkl
+#
+# OUTPUT:
+# the trees packed into contiguous arrays (trees/*.npy next to model.pkl)
+# that are opened memory-mapped and traversed for a whole batch of csr
+# rows at once - same probabilities as the estimator's predict_proba
+#
+# loading is near instant for every model; scoring is faster than the
+# estimator for boosted and single trees (sklearn loops over the
+# estimators in python) but compiled sklearn traversal wins for deep
+# forests - the export times both on the probe rows and records which
+# one the scoring should use
+#================================================================
+import os
+import shutil
+import timeit
+import numpy as np
+from scipy.sparse import issparse, csr_matrix
+
+TREE_FILES = ('feature.npy', 'threshold.npy', 'left.npy', 'right.npy', 'value.npy',
+              'roots.npy', 'depth.npy', 'meta.npy')
+# meta: number of features, link (0 mean of leaf values, 1 logistic),
+# faster (1 if the flat trees scored the probe rows faster than the model)
+MEAN, LOGISTIC = 0, 1
+
+
+def trees_path(location):
+  return os.path.join(location, 'trees')
+
+
+def has_trees(location):
+  path = trees_path(location)
+  return all(os.path.exists(os.path.join(path, f)) for f in TREE_FILES)
+
+
+def _leaf_proba(tree):
+  value = tree.value[:, 0, :]
+  total = value.sum(axis=1)
+  total[total == 0] = 1
+  return value / total[:, None]
+
+
+def _depth(tree):
+  depth = np.zeros(tree.node_count, dtype=np.int64)
+  for node in range(tree.node_count):
+    if tree.children_left[node] != -1:
+      depth[tree.children_left[node]] = depth[tree.children_right[node]] = depth[node] + 1
+  return int(depth.max())
+
+
+def _pack(trees, leaf_values):
+  """Concatenate the node arrays of all trees
+
+  Children become global node indexes and leaves point to themselves, so
+  every (row, tree) pair can take the same number of steps.
+  """
+  sizes = np.array([t.node_count for t in trees], dtype=np.int64)
+  roots = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int64)
+  feature, threshold, left, right = [], [], [], []
+  for tree, root in zip(trees, roots):
+    leaf = tree.children_left == -1
+    nodes = np.arange(tree.node_count) + root
+    feature.append(np.where(leaf, -1, tree.feature).astype(np.int32))
+    threshold.append(tree.threshold.astype(np.float64))
+    left.append(np.where(leaf, nodes, tree.children_left + root).astype(np.int64))
+    right.append(np.where(leaf, nodes, tree.children_right + root).astype(np.int64))
+  return dict(feature=np.concatenate(feature), threshold=np.concatenate(threshold),
+              left=np.concatenate(left), right=np.concatenate(right),
+              value=np.concatenate(leaf_values).astype(np.float64), roots=roots,
+              depth=np.array([max(_depth(t) for t in trees)], dtype=np.int64))
+
+
+def _candidates(model):
+  """The packed arrays of a model - more than one when the combination rule
+  depends on the sklearn version (the export keeps the one that matches)"""
+  name = type(model).__name__
+  if name == 'DecisionTreeClassifier':
+    return [(_pack([model.tree_], [_leaf_proba(model.tree_)[:, 1]]), MEAN)]
+  if name in ('RandomForestClassifier', 'ExtraTreesClassifier'):
+    trees = [est.tree_ for est in model.estimators_]
+    return [(_pack(trees, [_leaf_proba(t)[:, 1] for t in trees]), MEAN)]
+  if name == 'AdaBoostClassifier':
+    trees = [est.tree_ for est in model.estimators_]
+    weights = np.asarray(model.estimator_weights_[:len(trees)], dtype=np.float64)
+    total = np.asarray(model.estimator_weights_).sum()
+    eps = np.finfo(np.float64).eps
+    if getattr(model, 'algorithm', 'SAMME') == 'SAMME.R':
+      # decision = mean over trees of log p1 - log p0, probability = sigmoid(decision)
+      leaves = []
+      for t in trees:
+        p = np.clip(_leaf_proba(t), eps, None)
+        leaves.append((np.log(p[:, 1]) - np.log(p[:, 0])) / total)
+      return [(_pack(trees, leaves), LOGISTIC)]
+    # SAMME: soft votes (older sklearn) or hard votes that count once or
+    # twice (symmetric class coding) depending on the sklearn version
+    candidates = [(_pack(trees, [w * (2 * _leaf_proba(t)[:, 1] - 1) / total
+                                 for w, t in zip(weights, trees)]), LOGISTIC)]
+    for scale in (1.0, 2.0):
+      votes = [scale * w * np.where(_leaf_proba(t)[:, 1] > _leaf_proba(t)[:, 0], 1.0, -1.0) / total
+               for w, t in zip(weights, trees)]
+      candidates.append((_pack(trees, votes), LOGISTIC))
+    return candidates
+  return []
+
+
+def _n_features(model):
+  for attr in ('n_features_in_', 'n_features_'):
+    if hasattr(model, attr):
+      return int(getattr(model, attr))
+  if hasattr(model, 'tree_'):
+    return int(model.tree_.n_features)
+  return int(model.estimators_[0].tree_.n_features)
+
+
+def _write(arrays, path):
+  temp = '%s.tmp%s' % (path, os.getpid())
+  if os.path.exists(temp):
+    shutil.rmtree(temp)
+  os.makedirs(temp)
+  for name, array in arrays.items():
+    np.save(os.path.join(temp, name + '.npy'), array)
+  if os.path.exists(path):
+    shutil.rmtree(path)
+  os.rename(temp, path)
+
+
+def export_trees(model, location, probe=None):
+  """Save the flattened trees of model in location/trees
+
+  When probe rows are given the flattened trees must reproduce
+  model.predict_proba on them; nothing is written if they do not (or the
+  model is not a supported tree ensemble) and False is returned. The
+  probe is also timed with both to record which scores faster.
+  """
+  for arrays, link in _candidates(model):
+    arrays['meta'] = np.array([_n_features(model), link, 0], dtype=np.int64)
+    trees = FlatTrees(arrays)
+    if probe is not None and probe.shape[0] > 0:
+      start_time = timeit.default_timer()
+      flat = trees.predict_proba(probe)
+      flat_time = timeit.default_timer() - start_time
+      start_time = timeit.default_timer()
+      expected = model.predict_proba(probe)
+      model_time = timeit.default_timer() - start_time
+      if not np.allclose(flat, expected, atol=1e-6):
+        continue
+      arrays['meta'][2] = int(flat_time < model_time)
+    _write(arrays, trees_path(location))
+    return True
+  if os.path.exists(trees_path(location)):
+    shutil.rmtree(trees_path(location))
+  return False
+
+
+def load_trees(path, mmap_mode='r'):
+  """Open flattened trees (path is the trees directory) memory-mapped"""
+  return FlatTrees(dict((f[:-4], np.load(os.path.join(path, f), mmap_mode=mmap_mode))
+                        for f in TREE_FILES))
+
+
+class FlatTrees(object):
+  """Vectorised traversal of packed trees
+
+  All (row, tree) pairs of a batch walk down one level per step. Only the
+  columns the trees split on are densified (one row chunk at a time), so
+  each step is a gather from a small float32 block.
+  """
+
+  def __init__(self, arrays, max_pairs=4000000):
+    self.threshold = arrays['threshold']
+    self.left = arrays['left']
+    self.right = arrays['right']
+    self.value = arrays['value']
+    self.roots = np.asarray(arrays['roots'])
+    self.depth = int(arrays['depth'][0])
+    self.n_features, self.link, self.faster = [int(v) for v in arrays['meta']]
+    self.max_pairs = max_pairs
+    self.classes_ = np.array([0.0, 1.0])
+    feature = np.asarray(arrays['feature'])
+    self.columns = np.unique(feature[feature >= 0])
+    # the position of each node's split column in the densified block
+    self.column = np.searchsorted(self.columns, np.maximum(feature, 0)).astype(np.int64)
+    self.column[feature < 0] = 0
+
+  def _leaves(self, X):
+    n, ntrees = X.shape[0], self.roots.shape[0]
+    width = max(self.columns.shape[0], 1)
+    if self.columns.shape[0] > 0:
+      block = X[:, self.columns]
+      block = block.toarray() if issparse(block) else np.asarray(block)
+      block = block.astype(np.float32).ravel()
+    else:
+      block = np.zeros(n, dtype=np.float32)
+    node = np.tile(self.roots, n)
+    offset = np.repeat(np.arange(n, dtype=np.int64) * width, ntrees)
+    for step in range(self.depth):
+      x = block[offset + self.column[node]]
+      node = np.where(x <= self.threshold[node], self.left[node], self.right[node])
+    return node.reshape(n, ntrees)
+
+  def decision_function(self, X):
+    ntrees = max(self.roots.shape[0], 1)
+    rows = max(1, self.max_pairs // max(ntrees, self.columns.shape[0]))
+    out = np.empty(X.shape[0])
+    if issparse(X):
+      X = csr_matrix(X)
+    for start in range(0, X.shape[0], rows):
+      leaves = self._leaves(X[start:start+rows])
+      out[start:start+leaves.shape[0]] = self.value[leaves].sum(axis=1)
+    if self.link == MEAN:
+      out /= ntrees
+    return out
+
+  def predict_proba(self, X):
+    score = self.decision_function(X)
+    if self.link == LOGISTIC:
+      score = 1.0 / (1.0 + np.exp(-score))
+    return np.column_stack([1 - score, score])
+
+  def predict(self, X):
+    return (self.predict_proba(X)[:, 1] > 0.5).astype(np.float64)
+
+
+def fast_scorer(location, cache=None):
+  """The flattened trees saved with a model if they score it faster (else None)
+
+  cache is an optional model_cache.ModelCache the opened trees are kept in.
+  """
+  if not has_trees(location):
+    return None
+  if cache is None:
+    trees = load_trees(trees_path(location))
+  else:
+    trees = cache.get(os.path.join(trees_path(location), 'meta.npy'),
+                      loader=lambda path: load_trees(os.path.dirname(path)))
+  if trees.faster:
+    return trees
+  return None
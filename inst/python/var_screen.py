@@ -0,0 +1,142 @@
+#  variable importance screening strategies used before the random forest
+#===============================================================
+# INPUT:
+# 1) the training matrix (csr) and outcome
+# 2) the screening method:
+#    forest      - 2000 trees, max_depth 17, no bootstrap (the original screen)
+#    subsample   - forest on a row subsample, grown until the selection is stable
+#    chi2        - chi-squared statistic per column
+#    mutual_info - mutual information per column
+#    l1          - absolute coefficients along an L1 logistic regression path
+#
+# OUTPUT:
+# an importance per column - columns above the mean importance are kept
+#================================================================
+from __future__ import print_function
+import timeit
+import numpy as np
+
+
+def select(importance):
+  """The columns that are kept (importance above the mean)"""
+  importance = np.asarray(importance)
+  return np.where(importance > np.mean(importance))[0]
+
+
+def overlap(selected, reference):
+  """Jaccard overlap of two selected column sets"""
+  selected = set(np.asarray(selected).tolist())
+  reference = set(np.asarray(reference).tolist())
+  if not selected and not reference:
+    return 1.0
+  return len(selected & reference) / float(len(selected | reference))
+
+
+def forest_importance(X, y, seed=0, ntrees=2000, max_depth=17):
+  from sklearn.ensemble import RandomForestClassifier
+  mtry = int(np.round(np.sqrt(X.shape[1])))
+  rf = RandomForestClassifier(max_features=mtry, n_estimators=ntrees, max_depth=max_depth,
+                              min_samples_split=2, random_state=seed, n_jobs=-1, bootstrap=False)
+  rf = rf.fit(X, y)
+  return rf.feature_importances_
+
+
+def subsample_forest_importance(X, y, seed=0, sample=0.2, min_rows=10000, step=100,
+                                max_trees=2000, max_depth=17, tol=0.98):
+  """Forest on a row subsample grown in steps until the selected set is stable
+
+  All outcome rows are kept and the other rows are sampled. Trees are
+  added step at a time (warm_start) and growth stops once the Jaccard
+  overlap of the selection with the previous step reaches tol.
+  """
+  from sklearn.ensemble import RandomForestClassifier
+  rs = np.random.RandomState(seed)
+  y = np.asarray(y)
+  rows = np.arange(X.shape[0])
+  size = max(int(sample * X.shape[0]), min_rows)
+  if size < X.shape[0]:
+    outcomes = rows[y > 0]
+    others = rows[y <= 0]
+    keep = max(size - outcomes.shape[0], 0)
+    others = rs.choice(others, min(keep, others.shape[0]), replace=False)
+    rows = np.sort(np.concatenate([outcomes, others]))
+  X = X[rows, :]
+  y = y[rows]
+  mtry = int(np.round(np.sqrt(X.shape[1])))
+  rf = RandomForestClassifier(max_features=mtry, n_estimators=0, max_depth=max_depth,
+                              min_samples_split=2, random_state=seed, n_jobs=-1,
+                              bootstrap=False, warm_start=True)
+  previous = None
+  for ntrees in range(step, max_trees+step, step):
+    rf.set_params(n_estimators=min(ntrees, max_trees))
+    rf = rf.fit(X, y)
+    selected = select(rf.feature_importances_)
+    if previous is not None and overlap(selected, previous) >= tol:
+      break
+    previous = selected
+  return rf.feature_importances_
+
+
+def chi2_importance(X, y, seed=0):
+  from sklearn.feature_selection import chi2
+  return np.nan_to_num(chi2(X, y)[0])
+
+
+def mutual_info_importance(X, y, seed=0):
+  from sklearn.feature_selection import mutual_info_classif
+  return mutual_info_classif(X, y, discrete_features=True, random_state=seed)
+
+
+def l1_importance(X, y, seed=0, Cs=(0.001, 0.01, 0.1)):
+  """Largest absolute coefficient of each column along an L1 logistic path"""
+  from sklearn.linear_model import LogisticRegression
+  importance = np.zeros(X.shape[1])
+  for C in Cs:
+    lr = LogisticRegression(penalty='l1', C=C, solver='liblinear', random_state=seed)
+    lr = lr.fit(X, y)
+    importance = np.maximum(importance, np.abs(lr.coef_[0]))
+  return importance
+
+
+SCREENS = {'forest': forest_importance,
+           'subsample': subsample_forest_importance,
+           'chi2': chi2_importance,
+           'mutual_info': mutual_info_importance,
+           'l1': l1_importance}
+
+
+def screen(X, y, method='forest', seed=0, **kwargs):
+  """Column importance with the chosen method and the time it took"""
+  if method not in SCREENS:
+    raise ValueError('Unknown screening method %s - use one of %s' % (method, sorted(SCREENS)))
+  start_time = timeit.default_timer()
+  importance = SCREENS[method](X, y, seed=seed, **kwargs)
+  return np.asarray(importance, dtype=np.float64), timeit.default_timer() - start_time
+
+
+def compare_screens(X, y, methods=None, reference='forest', seed=0, quiet=True):
+  """Time each method and compare its selection with the reference method
+
+  Returns one dict per method with the time, the number of selected
+  columns, the Jaccard overlap with the reference selection and the
+  fraction of the reference selection that is kept.
+  """
+  if methods is None:
+    methods = sorted(SCREENS)
+  ref_importance, ref_time = screen(X, y, reference, seed=seed)
+  ref_selected = select(ref_importance)
+  results = []
+  for method in methods:
+    if method == reference:
+      importance, seconds = ref_importance, ref_time
+    else:
+      importance, seconds = screen(X, y, method, seed=seed)
+    selected = select(importance)
+    kept = len(set(selected.tolist()) & set(ref_selected.tolist()))
+    results.append(dict(method=method, seconds=seconds, selected=int(selected.shape[0]),
+                        overlap=overlap(selected, ref_selected),
+                        recall=kept / float(max(ref_selected.shape[0], 1))))
+    if not quiet:
+      print("%s: %.2f s, %s features, overlap with %s %.3f" % (
+        method, seconds, selected.shape[0], reference, results[-1]['overlap']))
+  return results